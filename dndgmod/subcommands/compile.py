@@ -1,37 +1,52 @@
 import shutil
 
-from ..util import files
+from ..util.environment import Environment, get_environment
+from ..util.fingerprint import fingerprint_files, load_fingerprints, save_fingerprints
 from ..util.patch import patch_dndg
+from ..util.pck import build_delta_pck
+from .decompile import get_fingerprints_path
 
 import subprocess
 import logging
 
 
 def compile_dndg(logger: logging.Logger = None, clear_save_game: bool = True, debug: bool = False,
-                 launch_dndg: bool = True):
+                 launch_dndg: bool = True, incremental: bool = False, jobs: int = 1, delta: bool = False,
+                 environment: Environment = None):
     """Compile modded Dungeons & Degenerate Gamblers."""
     if not logger:
         logger = logging
+    environment = environment or get_environment(logger)
     logger.info("DnDGMod by TotallyNotSeth\n\n")
-    appdata_directory = files.get_appdata_directory(logger=logger)
+    appdata_directory = environment.appdata_directory
     logger.debug(f"AppData Directory: {appdata_directory}")
-    patch_dndg(logger=logger)
-    if clear_save_game and (save_location := files.get_godot_data_directory() / "app_userdata" /
+    written_files = patch_dndg(logger=logger, incremental=incremental, jobs=jobs, appdata_directory=appdata_directory)
+    if clear_save_game and (save_location := environment.godot_data_directory / "app_userdata" /
                             "Dungeons & Degenerate Gamblers" / "0").exists():
         logger.info("Clearing modded save data")
         shutil.rmtree(save_location)
 
-    pck_path = files.get_dndg_pck_path()
+    pck_path = environment.pck_path
     logger.debug(f"D&DG .pck Path: {pck_path}")
-    exe_path = pck_path.parent / "DnDG_64.exe"
+    exe_path = environment.exe_path
 
-    logger.info("Compiling D&DG with Godot (this may take a moment)")
-    process = subprocess.Popen([appdata_directory / "dependencies" / "godot.exe", "--no-window", "--path",
-                                appdata_directory / "modified_src", "--export" + ("-debug" * debug), "dndgmod",
-                                exe_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    with process.stdout:
-        for line in iter(process.stdout.readline, b''):  # b'\n'-separated lines
-            logger.debug(line.decode("latin-1"))
+    if delta:
+        logger.info(f"Packing {len(written_files)} patched files on top of vanilla D&DG")
+        shutil.copy(appdata_directory / "DnDG_vanilla.exe", exe_path)
+        build_delta_pck(appdata_directory / "DnDG_vanilla.pck", appdata_directory / "modified_src", written_files,
+                        pck_path)
+    else:
+        logger.info("Compiling D&DG with Godot (this may take a moment)")
+        process = subprocess.Popen([appdata_directory / "dependencies" / "godot.exe", "--no-window", "--path",
+                                    appdata_directory / "modified_src", "--export" + ("-debug" * debug), "dndgmod",
+                                    exe_path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        with process.stdout:
+            for line in iter(process.stdout.readline, b''):  # b'\n'-separated lines
+                logger.debug(line.decode("latin-1"))
+    # remembered so decompiling a modded install can be caught
+    fingerprints = load_fingerprints(get_fingerprints_path(appdata_directory))
+    fingerprints["modded"] = fingerprint_files({"pck": pck_path, "exe": exe_path})
+    save_fingerprints(get_fingerprints_path(appdata_directory), fingerprints)
     logger.info("\nCompile Complete")
     if launch_dndg:
         logger.info("\nLaunching D&DG")
@@ -41,4 +56,4 @@ def compile_dndg(logger: logging.Logger = None, clear_save_game: bool = True, de
                 for line in iter(process.stdout.readline, b''):  # b'\n'-separated lines
                     logger.debug(line.decode("latin-1"))
         else:
-            subprocess.Popen([files.get_steam_install_path() / "steam.exe", "steam://rungameid/2400510"])
+            subprocess.Popen([environment.steam_path / "steam.exe", "steam://rungameid/2400510"])
@@ -1,46 +1,194 @@
+import json
 import logging
+from pathlib import Path
+import tempfile
+import typing
 
-from ..util import files
+from ..util.environment import Environment, get_environment
+from ..util.exceptions import DnDGModException
+from ..util.fingerprint import fingerprint_files, load_fingerprints, same_contents, save_fingerprints
+from ..util.pck import PckReader
 
 import subprocess
 import shutil
 
 
-def decompile(logger: logging.Logger = None):
-    """Decompile Dungeons & Degenerate Gamblers."""
+def get_vanilla_index_path(data_directory: Path) -> Path:
+    return data_directory / "vanilla_pck_index.json"
+
+
+def get_fingerprints_path(data_directory: Path) -> Path:
+    """Where the fingerprints of the vanilla game (as last decompiled) and the last modded build are kept."""
+    return data_directory / "fingerprints.json"
+
+
+def get_source_path(res_path: str) -> typing.Optional[str]:
+    """Maps a file in the pck to the src file it was exported from, or None if only a full recover can tell."""
+    path = res_path.removeprefix("res://")
+    if path.endswith(".gd.remap"):
+        return path.removesuffix(".remap")
+    if path.endswith((".gdc", ".gde")):
+        return path[:-1]
+    if path.startswith(".import/") or path.endswith((".import", ".remap")) or path == "project.binary":
+        return None
+    return path
+
+
+def get_source_paths(res_paths: typing.Iterable[str]) -> set[str]:
+    """Maps the files in a pck to every src file they were exported from, including imported assets."""
+    sources = set()
+    for res_path in res_paths:
+        if (source := get_source_path(res_path)) is not None:
+            sources.add(source)
+        elif res_path.endswith(".import") and not res_path.startswith("res://.import/"):
+            sources.add(res_path.removeprefix("res://").removesuffix(".import"))
+    return sources
+
+
+def find_changed_files(pck_path: Path, data_directory: Path) -> typing.Optional[list[str]]:
+    """Compares a pck's directory against the vanilla pck src was decompiled from, without reading any file data.
+
+    Args:
+        pck_path: The pck to check, usually the installed DnDG_64.pck.
+        data_directory: DnDGMod's AppData directory.
+
+    Returns:
+        The `res://` paths that were added, removed or changed, or None if src has never been decompiled.
+    """
+    try:
+        with open(get_vanilla_index_path(data_directory)) as f:
+            vanilla = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with PckReader(pck_path) as reader:
+        index = reader.index()
+    return sorted(path for path in vanilla.keys() | index.keys() if vanilla.get(path) != index.get(path))
+
+
+def index_vanilla_pck(logger: logging.Logger, data_directory: Path):
+    logger.info("Indexing vanilla pck")
+    with PckReader(data_directory / "DnDG_vanilla.pck") as reader, \
+            open(get_vanilla_index_path(data_directory), "w") as f:
+        json.dump(reader.index(), f)
+
+
+def run_gdre_tools(logger: logging.Logger, gdre_tools_path: Path, pck_path: Path, output_directory: Path,
+                   include: list[str] = ()):
+    process = subprocess.Popen([gdre_tools_path, "--headless", f"--recover={pck_path}",
+                                f"--output-dir={output_directory}", *(f"--include={path}" for path in include)],
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    with process.stdout:
+        for line in iter(process.stdout.readline, b''):  # b'\n'-separated lines
+            logger.debug(line.decode("latin-1"))
+
+
+def decompile_only(logger: logging.Logger, data_directory: Path, paths: list[str]):
+    """Refreshes selected files in src from the vanilla pck, leaving everything else alone.
+
+    Files stored as-is in the pck are streamed straight out of it. Anything that has to be recovered (compiled
+    scripts, imported textures) is recovered by GDRE Tools, restricted to just those files. Files the pck no longer
+    has at all are deleted from src.
+    """
+    vanilla_pck_path = data_directory / "DnDG_vanilla.pck"
+    output_directory = data_directory / "src"
+    if not vanilla_pck_path.exists() or not output_directory.exists():
+        raise DnDGModException("D&DG has to be fully decompiled once before individual files can be decompiled")
+    with PckReader(vanilla_pck_path) as reader:
+        logger.info(f"Extracting {len(paths)} files from the vanilla pck")
+        missing = [path.removeprefix("res://")
+                   for path in reader.extract((f"res://{path}" for path in paths), output_directory)]
+        sources = get_source_paths(reader.entries)
+    recover = [path for path in missing if path in sources]
+    for path in missing:
+        if path not in sources:
+            logger.info(f"Deleting `{path}`, which was removed from the pck")
+            (output_directory / path).unlink(missing_ok=True)
+    if not recover:
+        return
+    logger.info(f"Recovering {len(recover)} files with GDRE Tools")
+    with tempfile.TemporaryDirectory(dir=data_directory) as recovery_directory:
+        recovery_directory = Path(recovery_directory)
+        run_gdre_tools(logger, data_directory / "dependencies" / "gdre_tools.exe", vanilla_pck_path,
+                       recovery_directory, include=[f"res://{path}" for path in recover])
+        for path in recover:
+            if not (recovery_directory / path).exists():
+                logger.warning(f"`{path}` could not be recovered from the vanilla pck")
+                continue
+            (output_directory / path).parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(recovery_directory / path, output_directory / path)
+
+
+def decompile(logger: logging.Logger = None, only: list[str] = None, environment: Environment = None):
+    """Decompile Dungeons & Degenerate Gamblers.
+
+    Args:
+        logger: The logger to report progress to.
+        only: Only refresh these files (POSIX-style paths relative to src) from the existing vanilla pck.
+        environment: Where D&DG and DnDGMod's files are, if already resolved.
+    """
     if not logger:
         logger = logging
+    environment = environment or get_environment(logger)
 
     logger.info("DnDGMod by TotallyNotSeth\n\n")
 
-    data_directory = files.get_appdata_directory(logger=logger)
+    data_directory = environment.appdata_directory
     logger.debug(f"AppData Directory: {data_directory}")
+    if only is not None:
+        decompile_only(logger, data_directory, only)
+        logger.info("\nDecompile Complete")
+        return
     dependencies_directory = data_directory / "dependencies"
 
     gdre_tools_path = dependencies_directory / "gdre_tools.exe"
     output_directory = data_directory / "src"
     output_directory.mkdir(exist_ok=True, parents=True)
-    pck_path = files.get_dndg_pck_path()
+    pck_path = environment.pck_path
+    exe_path = environment.exe_path
+
+    logger.info("Fingerprinting installed D&DG")
+    fingerprints = load_fingerprints(get_fingerprints_path(data_directory))
+    installed = fingerprint_files({"pck": pck_path, "exe": exe_path}, fingerprints.values())
+    if same_contents(installed, fingerprints.get("modded")):
+        logger.warning("The installed D&DG is a DnDGMod build, revert D&DG to vanilla before decompiling it")
+        return
+    src_populated = any(output_directory.iterdir())
+    if src_populated and same_contents(installed, fingerprints.get("vanilla")):
+        logger.info("D&DG hasn't changed since it was last decompiled, skipping decompile")
+        fingerprints["vanilla"] = installed
+        save_fingerprints(get_fingerprints_path(data_directory), fingerprints)
+        return
 
     new_pck_path = data_directory / "DnDG_vanilla.pck"
-    shutil.copy(pck_path, new_pck_path)
     new_exe_path = data_directory / "DnDG_vanilla.exe"
-    shutil.copy(pck_path.parent / "DnDG_64.exe", new_exe_path)
+    changed = find_changed_files(pck_path, data_directory) if src_populated else None
+    if changed == [] and not same_contents(installed["pck"], (fingerprints.get("vanilla") or {}).get("pck")):
+        # the pck changed but its directory doesn't show how, so the index can't be trusted
+        changed = None
+    shutil.copy(pck_path, new_pck_path)
+    shutil.copy(exe_path, new_exe_path)
+    if changed is not None and None not in (sources := {get_source_path(path) for path in changed}):
+        logger.info(f"{len(changed)} files in the pck changed since the last decompile, decompiling just those")
+        decompile_only(logger, data_directory, sorted(sources))
+        index_vanilla_pck(logger, data_directory)
+        fingerprints["vanilla"] = installed
+        save_fingerprints(get_fingerprints_path(data_directory), fingerprints)
+        logger.info("\nDecompile Complete")
+        return
+
     logger.info("Clearing output directory")
     shutil.rmtree(output_directory)
     logger.info("Decompiling D&DG with GDRE Tools (this may take a moment)")
     print([gdre_tools_path, "--headless", f"--recover={new_pck_path}",
                                 f"--output-dir={output_directory}"])
-    process = subprocess.Popen([gdre_tools_path, "--headless", f"--recover={new_pck_path}",
-                                f"--output-dir={output_directory}"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    with process.stdout:
-        for line in iter(process.stdout.readline, b''):  # b'\n'-separated lines
-            logger.debug(line.decode("latin-1"))
+    run_gdre_tools(logger, gdre_tools_path, new_pck_path, output_directory)
+
+    index_vanilla_pck(logger, data_directory)
 
     logger.info("Grabbing export presets")
     shutil.copy(dependencies_directory / "export_presets.cfg", output_directory / "export_presets.cfg")
 
-    if not (templates_directory := files.get_godot_data_directory() / "templates" / "3.6.stable").exists():
+    if not (templates_directory := environment.godot_data_directory / "templates" / "3.6.stable").exists():
         logging.info("Grabbing export templates")
         templates_directory.mkdir(parents=True)
         for template in ["windows_32_debug.exe", "windows_64_debug.exe",
@@ -52,4 +200,6 @@ def decompile(logger: logging.Logger = None):
         shutil.copytree(dependencies_directory / "godotsteam", output_directory / "addons" / "godotsteam")
     shutil.copy(dependencies_directory / "project.godot", output_directory / "project.godot")
 
+    fingerprints["vanilla"] = installed
+    save_fingerprints(get_fingerprints_path(data_directory), fingerprints)
     logger.info("\nDecompile Complete")
@@ -1,21 +1,21 @@
-from zipfile import ZipFile
-
+from pathlib import Path
+import logging
 import os
 import subprocess
 
-from ..util import files
+from ..util.environment import Environment, get_environment
+from ..util.packaging import write_package
 
 
-def package(slug, zip_file_path, open_explorer: bool = False):
-    data_directory = files.get_appdata_directory()
+def package(slug, zip_file_path, open_explorer: bool = False, environment: Environment = None,
+            logger: logging.Logger = None):
+    data_directory = (environment or get_environment(logger)).appdata_directory
     mod_directory = data_directory / "mods" / slug
 
     if not os.path.exists(mod_directory):
         raise FileNotFoundError(f"Directory {mod_directory} does not exist!")
 
-    with ZipFile(zip_file_path, "w") as archive:
-        for file_path in mod_directory.rglob("*"):
-            archive.write(file_path, arcname=file_path.relative_to(mod_directory))
+    write_package(mod_directory, Path(zip_file_path), logger=logger)
 
     if open_explorer:
         subprocess.Popen(f'explorer /select,"{zip_file_path.replace('/', '\\')}"')
@@ -1,19 +1,20 @@
 import logging
 
-from ..util import files
+from ..util.environment import Environment, get_environment
 
 import shutil
 
 
-def revert(logger: logging.Logger):
+def revert(logger: logging.Logger, environment: Environment = None):
     if not logger:
         logger = logging
+    environment = environment or get_environment(logger)
 
     logger.info("DnDGMod by TotallyNotSeth\n\n")
-    pck_path = files.get_dndg_pck_path()
+    pck_path = environment.pck_path
     logger.debug(f"D&DG .pck path: {pck_path}")
-    exe_path = pck_path.parent / "DnDG_64.exe"
-    data_directory = files.get_appdata_directory()
+    exe_path = environment.exe_path
+    data_directory = environment.appdata_directory
     logger.debug(f"AppData directory: {data_directory}")
 
     logger.info("Copying DnDG_64.pck")
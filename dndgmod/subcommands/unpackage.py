@@ -1,30 +1,30 @@
-from zipfile import ZipFile
 from pathlib import Path
-import shutil
 import logging
+import typing
 
 from ..util import files
+from ..util.environment import Environment, get_environment
+from ..util.install import install_mods
 
 
-def unpackage(zip_file_path: Path, logger=None):
+def install(zip_file_paths: typing.Iterable[Path], logger=None, environment: Environment = None,
+            jobs: int = None) -> dict[Path, typing.Optional[Path]]:
+    """Installs DnDGMod ZIP Packages, several at once.
+
+    Returns:
+        Where each package was installed to, or None if it couldn't be.
+    """
     if not logger:
         logger = logging
     logger.info("DnDGMod by TotallyNotSeth\n\n")
-    data_directory = files.get_appdata_directory()
+    data_directory = (environment or get_environment(logger)).appdata_directory
     logger.debug(f"AppData directory: {data_directory}")
-    mod_directory = data_directory / "mods" / zip_file_path.name.rstrip(".zip")
-    logger.info(f"Source ZIP: {zip_file_path}")
-    logger.info(f"Destination directory: {mod_directory}")
-    with ZipFile(zip_file_path, "r") as archive:
-        logger.info("Extracting...")
-        archive.extractall(mod_directory)
-    if not (mod_directory / "mod.yaml").exists():
-        if ((submod_directory := mod_directory / mod_directory.stem) / "mod.yaml").exists():
-            shutil.copytree(submod_directory, mod_directory, dirs_exist_ok=True)
-            shutil.rmtree(submod_directory)
-            logger.info("Mod loaded!")
-        else:
-            shutil.rmtree(mod_directory)
-            logger.error(f"{zip_file_path} Has An Invalid DnDGMod ZIP Package Format")
-    else:
-        logger.info("Mod loaded!")
+    results = install_mods([Path(path) for path in zip_file_paths], data_directory / "mods",
+                           files.get_cache_directory(data_directory, "installs"), logger=logger, workers=jobs)
+    installed = sum(mod_directory is not None for mod_directory in results.values())
+    logger.info(f"{installed} of {len(results)} mods loaded!")
+    return results
+
+
+def unpackage(zip_file_path: Path, logger=None, environment: Environment = None):
+    install([zip_file_path], logger=logger, environment=environment)
@@ -0,0 +1,104 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+from pathlib import Path
+import shutil
+
+import numpy as np
+from PIL import Image
+
+from .blobs import link_or_copy
+from .manifest import hash_file
+
+PREPROCESS_VERSION = 1
+
+
+def place_files(copies: list[tuple[Path, Path]]) -> int:
+    """Copies files into place, storing each distinct file contents only once.
+
+    Every source is hashed once, no matter how many targets it is copied to. The first target of each distinct
+    contents gets a real copy and every other target is hardlinked to it, so e.g. a hundred cards using the placeholder
+    art cost one copy. Copies are made on a thread pool. Targets must not be written to in place afterwards without
+    breaking their links first.
+
+    Args:
+        copies: `(source, target)` pairs. Later pairs for the same target win.
+
+    Returns:
+        The number of distinct files that were copied.
+    """
+    targets = dict((target, source) for source, target in copies)
+    with ThreadPoolExecutor() as executor:
+        sources = sorted(set(targets.values()))
+        digests = dict(zip(sources, executor.map(hash_file, sources)))
+        groups = {}
+        for target, source in targets.items():
+            groups.setdefault(digests[source], []).append((source, target))
+
+        def place_group(group: list[tuple[Path, Path]]):
+            (source, first_target), *others = group
+            first_target.unlink(missing_ok=True)
+            shutil.copy(source, first_target)
+            for _, target in others:
+                link_or_copy(first_target, target)
+
+        list(executor.map(place_group, groups.values()))
+    return len(groups)
+
+
+class ArtPreprocessor:
+    """Normalises art to the size and format Godot expects, caching the results by the source's hash.
+
+    Art is converted to 8-bit RGBA, resized (nearest neighbour, to keep pixel art crisp) if it isn't exactly one sprite
+    in size, and recompressed losslessly, so Godot never has to import oversized or 16-bit PNGs and the exported pck
+    only carries what the game actually shows.
+    """
+
+    def __init__(self, cache_directory: Path, width: int, height: int, logger: logging.Logger = None):
+        self.cache_directory = cache_directory
+        self.width = width
+        self.height = height
+        self.logger = logger or logging
+        self.used = set()
+
+    def cached_path(self, digest: str) -> Path:
+        return self.cache_directory / f"{digest}-{self.width}x{self.height}-v{PREPROCESS_VERSION}.png"
+
+    def normalise(self, source: Path, target: Path):
+        with Image.open(source) as art:
+            if art.mode.startswith("I"):
+                # 16-bit greyscale, which `convert` would clip rather than scale down
+                art = Image.fromarray((np.asarray(art, dtype=np.uint32) >> 8).clip(0, 255).astype(np.uint8), "L")
+            art = art.convert("RGBA")
+        if art.size != (self.width, self.height):
+            self.logger.warning(f"`{source}` is {art.width}x{art.height}, resizing it to the expected "
+                                f"{self.width}x{self.height}")
+            art = art.resize((self.width, self.height), Image.Resampling.NEAREST)
+        temporary_path = target.with_suffix(".tmp")
+        art.save(temporary_path, "PNG", optimize=True)
+        os.replace(temporary_path, target)
+
+    def preprocess_all(self, art: list[tuple[int, Path]]) -> list[tuple[int, Path]]:
+        """Normalises art on a thread pool, reusing cached results for any source that was normalised before.
+
+        Args:
+            art: `(id, path)` pairs.
+
+        Returns:
+            The same pairs, pointing at the normalised art in the cache.
+        """
+        sources = sorted({path for _, path in art})
+        with ThreadPoolExecutor() as executor:
+            cached = {source: self.cached_path(digest)
+                      for source, digest in zip(sources, executor.map(hash_file, sources))}
+            # each distinct contents is normalised once, even if several sources share it
+            missing = {target: source for source, target in cached.items() if not target.exists()}
+            list(executor.map(self.normalise, missing.values(), missing.keys()))
+        self.used.update(target.name for target in cached.values())
+        return [(id_, cached[path]) for id_, path in art]
+
+    def prune(self):
+        """Removes cached art that wasn't used since this preprocessor was created."""
+        for entry in os.scandir(self.cache_directory):
+            if entry.name not in self.used:
+                os.unlink(entry.path)
@@ -0,0 +1,129 @@
+import json
+import os
+from pathlib import Path
+import shutil
+
+from .manifest import hash_tree
+
+STORE_VERSION = 1
+# files Godot itself may rewrite in place while exporting, which must never share storage with the vanilla snapshot
+GODOT_OWNED_DIRECTORIES = (".import",)
+GODOT_OWNED_SUFFIXES = (".import",)
+GODOT_OWNED_FILES = ("project.godot",)
+
+
+def godot_owned(path: str) -> bool:
+    """Returns whether a POSIX-style path relative to a Godot project could be rewritten by Godot."""
+    return (path.split("/", 1)[0] in GODOT_OWNED_DIRECTORIES or path.endswith(GODOT_OWNED_SUFFIXES)
+            or path in GODOT_OWNED_FILES)
+
+
+def link_or_copy(source: Path, target: Path):
+    """Hardlinks `target` to `source`, falling back to a copy where hardlinks aren't possible."""
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        # e.g. the filesystem has no hardlinks
+        shutil.copy(source, target)
+
+
+def break_link(path: Path):
+    """Gives a hardlinked file its own copy of its contents, so writing to it leaves every other link untouched."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return
+    if stat.st_nlink > 1:
+        temporary_path = path.with_name(path.name + ".dndgmod-tmp")
+        shutil.copy2(path, temporary_path)
+        os.replace(temporary_path, path)
+
+
+class BlobStore:
+    """A content-addressed store of vanilla source files.
+
+    Each distinct file is stored once, named after its SHA-256 digest. Trees are built from the store with hardlinks,
+    so a build tree costs no more than its directory entries until a file in it is changed. Files that are written to
+    must first be given their own copy with `break_link`.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.objects = root / "objects"
+        self.index_path = root / "index.json"
+        self.directories = []
+
+    def blob(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def load_index(self) -> dict:
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if index.get("version") != STORE_VERSION:
+            return {}
+        self.directories = index["directories"]
+        return index["tree"]
+
+    def snapshot(self, source: Path) -> dict[str, list]:
+        """Adds every file below a directory to the store.
+
+        Files whose size and mtime haven't changed since the last snapshot are neither hashed nor copied again, and
+        blobs no longer referenced by the snapshot are removed. The directory layout (including empty directories) is
+        remembered too, so `materialise` can recreate it.
+
+        Returns:
+            A mapping of POSIX-style relative paths to `[size, mtime_ns, sha256]`.
+        """
+        tree = hash_tree(source, self.load_index())
+        for path, (_, _, digest) in tree.items():
+            if not (blob := self.blob(digest)).exists():
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                temporary_path = blob.with_suffix(".tmp")
+                shutil.copy2(source / path, temporary_path)
+                os.replace(temporary_path, blob)
+        self.prune({digest for _, _, digest in tree.values()})
+        self.directories = sorted(Path(directory).relative_to(source).as_posix()
+                                  for directory, _, _ in os.walk(source))
+        with open(self.index_path, "w") as f:
+            json.dump({"version": STORE_VERSION, "tree": tree, "directories": self.directories}, f)
+        return tree
+
+    def prune(self, keep: set[str]):
+        if not self.objects.exists():
+            return
+        for directory in os.scandir(self.objects):
+            for blob in os.scandir(directory.path):
+                if blob.name not in keep:
+                    os.unlink(blob.path)
+
+    def materialise_file(self, digest: str, target: Path, link: bool = True):
+        """Places a stored blob at `target`, replacing whatever is there.
+
+        Args:
+            digest: The blob's SHA-256 digest.
+            target: Where the file should appear.
+            link: Hardlink the blob if possible, rather than copying it.
+        """
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.unlink(missing_ok=True)
+        if link:
+            try:
+                os.link(self.blob(digest), target)
+                return
+            except OSError:
+                # e.g. the store and the target are on different drives, or the filesystem has no hardlinks
+                pass
+        shutil.copy2(self.blob(digest), target)
+
+    def materialise(self, tree: dict[str, list], destination: Path):
+        """Builds a fresh copy of the last snapshot at `destination`, replacing anything already there."""
+        if destination.exists():
+            shutil.rmtree(destination)
+        for directory in self.directories:
+            (destination / directory).mkdir(parents=True, exist_ok=True)
+        for path, (_, _, digest) in tree.items():
+            self.materialise_file(digest, destination / path, link=not godot_owned(path))
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+from zipfile import ZipFile
+
+from .blobs import link_or_copy
+from .download import download, fetch_json, join_source
+from .manifest import digests, hash_tree
+
+DEPENDENCIES_MIRROR = "https://dndgmod.s3.us-east-2.amazonaws.com"
+DEPENDENCIES_ZIP = "dndgmod_dependencies.zip"
+# the bundle's files one by one, under the same paths as in the ZIP
+DEPENDENCIES_FILES = "dndgmod_dependencies"
+# `{"dndgmod_dependencies.zip": "<sha256>", "files": {"<path>": {"size": ..., "sha256": ...}, ...}}`, where `files` is
+# optional. Without it, updates fall back to downloading the whole ZIP
+DEPENDENCIES_MANIFEST = "dndgmod_dependencies.json"
+DOWNLOAD_WORKERS = 4
+
+
+def swap_directory(new: Path, target: Path, old: Path = None):
+    """Replaces `target` with `new` using renames, so `target` is never left half-updated.
+
+    Args:
+        new: The directory to move into place.
+        target: The directory to replace.
+        old: Where to move `target` to while the swap happens. Defaults to `target` with `.old` appended.
+    """
+    old = old or target.with_name(target.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if target.exists():
+        os.replace(target, old)
+    os.replace(new, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class DependencyInstaller:
+    """Installs and updates the dependencies bundle (Godot, GDRE Tools, export templates, GodotSteam...).
+
+    Updates are staged in a separate directory and swapped in once complete. If the mirror's manifest lists the
+    bundle's files, only files whose hash changed are downloaded, and unchanged files are hardlinked over from the
+    installed bundle. Otherwise the whole ZIP is downloaded and extracted.
+    """
+
+    def __init__(self, dependencies_directory: Path, downloads_directory: Path, mirror: str,
+                 logger: logging.Logger = None):
+        self.dependencies_directory = dependencies_directory
+        self.staging_directory = dependencies_directory.with_name(dependencies_directory.name + ".new")
+        self.downloads_directory = downloads_directory
+        self.index_path = downloads_directory / "dependencies_index.json"
+        self.mirror = mirror
+        self.logger = logger or logging
+
+    def load_index(self) -> dict[str, list]:
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def fetch_manifest(self) -> dict:
+        try:
+            return fetch_json(join_source(self.mirror, DEPENDENCIES_MANIFEST))
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Couldn't fetch the dependencies manifest, downloads won't be verified ({e})")
+            return {}
+
+    def install(self):
+        """Brings the dependencies directory up to date with the mirror."""
+        old = self.dependencies_directory.with_name(self.dependencies_directory.name + ".old")
+        if not self.dependencies_directory.exists() and old.exists():
+            # an earlier swap was interrupted between its renames
+            os.replace(old, self.dependencies_directory)
+        shutil.rmtree(self.staging_directory, ignore_errors=True)
+        self.staging_directory.mkdir(parents=True)
+
+        manifest = self.fetch_manifest()
+        if files := manifest.get("files"):
+            self.stage_files(files)
+        else:
+            self.stage_zip(manifest.get(DEPENDENCIES_ZIP))
+        swap_directory(self.staging_directory, self.dependencies_directory)
+
+        with open(self.index_path, "w") as f:
+            json.dump(hash_tree(self.dependencies_directory, self.load_index()), f)
+        self.logger.info("Dependency acquisition completed!")
+
+    def stage_files(self, files: dict[str, dict]):
+        installed = {}
+        if self.dependencies_directory.exists():
+            installed = digests(hash_tree(self.dependencies_directory, self.load_index()))
+        changed = sorted(path for path, entry in files.items() if installed.get(path) != entry["sha256"])
+        self.logger.info(f"{len(changed)} of {len(files)} dependencies changed")
+        for path in files.keys() - set(changed):
+            (self.staging_directory / path).parent.mkdir(parents=True, exist_ok=True)
+            link_or_copy(self.dependencies_directory / path, self.staging_directory / path)
+
+        # files with the same contents are downloaded once, since they share a download path
+        by_hash = {}
+        for path in changed:
+            by_hash.setdefault(files[path]["sha256"], []).append(path)
+
+        def fetch(sha256: str):
+            first, *others = by_hash[sha256]
+            self.logger.info(f"Downloading {first}")
+            # downloads are kept by hash outside the staging directory, so an interrupted update can resume them
+            downloaded = self.downloads_directory / sha256
+            download(join_source(self.mirror, f"{DEPENDENCIES_FILES}/{first}"), downloaded, sha256=sha256,
+                     size=files[first].get("size"), logger=self.logger)
+            for path in others:
+                (self.staging_directory / path).parent.mkdir(parents=True, exist_ok=True)
+                link_or_copy(downloaded, self.staging_directory / path)
+            (self.staging_directory / first).parent.mkdir(parents=True, exist_ok=True)
+            os.replace(downloaded, self.staging_directory / first)
+
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+            list(executor.map(fetch, by_hash))
+
+    def stage_zip(self, sha256: str = None):
+        zip_path = self.downloads_directory / DEPENDENCIES_ZIP
+        self.logger.info(f"Downloading dependencies ZIP from {self.mirror}")
+        download(join_source(self.mirror, DEPENDENCIES_ZIP), zip_path, sha256=sha256, logger=self.logger)
+        self.logger.info("Extracting dependencies ZIP to destination directory")
+        with ZipFile(zip_path) as zip_file:
+            for file in zip_file.namelist():
+                self.logger.info(f"Extracting {file}")
+                zip_file.extract(file, self.staging_directory)
+        self.logger.info("Deleting dependencies ZIP")
+        zip_path.unlink()
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import typing
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from .exceptions import DownloadException
+from .manifest import hash_file
+
+BLOCK_SIZE = 1 << 20
+CHUNK_COUNT = 4
+MIN_CHUNK_SIZE = 8 << 20  # smaller downloads aren't worth splitting into ranges
+TIMEOUT = 30
+
+
+def is_local(source: str) -> bool:
+    """Returns whether a source is a local path or `file://` URL rather than something to fetch over HTTP."""
+    return urllib.parse.urlparse(source).scheme not in ("http", "https")
+
+
+def local_path(source: str) -> Path:
+    if source.startswith("file:"):
+        return Path(urllib.request.url2pathname(urllib.parse.urlparse(source).path))
+    return Path(source)
+
+
+def join_source(base: str, name: str) -> str:
+    """Resolves a file name against a mirror, which may be a URL, a `file://` URL or a local directory."""
+    if is_local(base):
+        return str(local_path(base) / name)
+    return base.rstrip("/") + "/" + name
+
+
+def fetch_json(source: str) -> typing.Any:
+    if is_local(source):
+        with open(local_path(source)) as f:
+            return json.load(f)
+    with urllib.request.urlopen(source, timeout=TIMEOUT) as response:
+        return json.load(response)
+
+
+def _probe(url: str) -> tuple[typing.Optional[int], bool, str]:
+    """Returns a remote file's size (if known), whether it can be fetched in ranges, and its validator (ETag or
+    Last-Modified), used to tell whether partial downloads still belong to the same file."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=TIMEOUT) as response:
+            size = response.headers.get("Content-Length")
+            ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            validator = response.headers.get("ETag") or response.headers.get("Last-Modified") or ""
+    except urllib.error.HTTPError:
+        # some servers refuse HEAD requests, so just fetch the whole file in one go
+        return None, False, ""
+    size = int(size) if size is not None else None
+    return size, ranges and bool(size), validator
+
+
+def _fetch_range(url: str, part_path: Path, start: int, end: typing.Optional[int]):
+    """Downloads `url` from byte `start` up to and including `end` into `part_path`, resuming whatever part of the
+    range is already there."""
+    have = part_path.stat().st_size if part_path.exists() else 0
+    if end is not None and start + have > end:
+        return
+    request = urllib.request.Request(url)
+    if end is not None:
+        request.add_header("Range", f"bytes={start + have}-{end}")
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        if end is not None and response.status != 206:
+            raise DownloadException(f"`{url}` ignored a range request")
+        with open(part_path, "ab" if end is not None else "wb") as f:
+            while block := response.read(BLOCK_SIZE):
+                f.write(block)
+
+
+def _download_http(url: str, destination: Path, logger: logging.Logger):
+    size, ranges, validator = _probe(url)
+    state_path = destination.with_name(destination.name + ".download.json")
+    chunk_count = max(1, min(CHUNK_COUNT, size // MIN_CHUNK_SIZE)) if ranges else 1
+    state = {"url": url, "size": size, "validator": validator, "chunks": chunk_count}
+    part_paths = [destination.with_name(f"{destination.name}.part{i}") for i in range(chunk_count)]
+    try:
+        with open(state_path) as f:
+            resumable = ranges and json.load(f) == state
+    except (OSError, ValueError):
+        resumable = False
+    if not resumable:
+        for part_path in destination.parent.glob(f"{destination.name}.part*"):
+            part_path.unlink()
+        with open(state_path, "w") as f:
+            json.dump(state, f)
+    elif any(part_path.exists() for part_path in part_paths):
+        logger.info(f"Resuming download of `{url}`")
+
+    if ranges:
+        bounds = [(size * i // chunk_count, size * (i + 1) // chunk_count - 1) for i in range(chunk_count)]
+    else:
+        bounds = [(0, None)]
+    with ThreadPoolExecutor(max_workers=chunk_count) as executor:
+        list(executor.map(lambda part: _fetch_range(url, part[0], *part[1]), zip(part_paths, bounds)))
+
+    temporary_path = destination.with_name(destination.name + ".tmp")
+    with open(temporary_path, "wb") as f:
+        for part_path in part_paths:
+            with open(part_path, "rb") as part:
+                shutil.copyfileobj(part, f, BLOCK_SIZE)
+    os.replace(temporary_path, destination)
+    for part_path in part_paths:
+        part_path.unlink()
+    state_path.unlink()
+
+
+def download(source: str, destination: Path, sha256: str = None, size: int = None, logger: logging.Logger = None):
+    """Downloads a file, resuming earlier interrupted attempts and verifying it if its hash is known.
+
+    Over HTTP(S), servers that support ranges have large files fetched as several ranges in parallel. Each range is
+    kept in its own part file next to the destination, so an interrupted download carries on where it stopped as long
+    as the remote file hasn't changed. Sources can also be local paths or `file://` URLs, which are just copied.
+
+    Args:
+        source: The URL or path to download from.
+        destination: Where to save the file. It only appears there once it is complete and verified.
+        sha256: The file's expected SHA-256 digest, if known.
+        size: The file's expected size in bytes, if known.
+        logger: The logger to report progress to.
+
+    Raises:
+        DownloadException: The download failed or the file didn't match `sha256` or `size`.
+    """
+    if not logger:
+        logger = logging
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    if sha256 and destination.exists() and hash_file(destination) == sha256:
+        logger.info(f"`{destination.name}` was already downloaded")
+        return
+    try:
+        if is_local(source):
+            temporary_path = destination.with_name(destination.name + ".tmp")
+            shutil.copy(local_path(source), temporary_path)
+            os.replace(temporary_path, destination)
+        else:
+            _download_http(source, destination, logger)
+    except (OSError, urllib.error.URLError) as e:
+        raise DownloadException(f"Couldn't download `{source}`: {e}") from e
+    if size is not None and (actual_size := destination.stat().st_size) != size:
+        destination.unlink()
+        raise DownloadException(f"`{source}` is {actual_size} bytes, expected {size}")
+    if sha256 and (digest := hash_file(destination)) != sha256:
+        destination.unlink()
+        raise DownloadException(f"`{source}` has SHA-256 {digest}, expected {sha256}")
@@ -0,0 +1,97 @@
+from collections import namedtuple
+import typing
+from pathlib import Path
+
+from .exceptions import AnchorNotFoundException
+
+# position is one of "before", "at" (replacing the anchor line) or "after" (the default)
+ScriptPatch = namedtuple("ScriptPatch", "path anchor payload position match_indent", defaults=("after", False))
+
+
+class EditBuffer:
+    """Keeps text files from a source tree in memory while they are being patched.
+
+    Each file is read the first time it is requested and written back once when the buffer is flushed, no matter how
+    many edits were made to it in between.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.contents = {}
+        self.dirty = set()
+
+    def read(self, path: str) -> str:
+        """Returns the current (possibly edited) contents of a file.
+
+        Args:
+            path: A POSIX-style path relative to the buffer's root.
+        """
+        if path not in self.contents:
+            with open(self.root / path) as f:
+                self.contents[path] = f.read()
+        return self.contents[path]
+
+    def loaded(self, path: str) -> bool:
+        """Returns whether a file has been read into (or written to) the buffer yet."""
+        return path in self.contents
+
+    def write(self, path: str, contents: str):
+        """Replaces the contents of a file. Nothing touches the disk until `flush` is called."""
+        self.contents[path] = contents
+        self.dirty.add(path)
+
+    def flush(self, output: typing.Callable[[str], Path]):
+        """Writes every edited file back to disk.
+
+        Args:
+            output: Maps a buffered path to the location it should be written to.
+        """
+        for path in sorted(self.dirty):
+            with open(output(path), "w") as f:
+                f.write(self.contents[path])
+        self.dirty.clear()
+
+
+def render_payload(payload: typing.Union[str, list[str]], indent: str) -> str:
+    if isinstance(payload, list):
+        return "".join(indent + line + "\n" for line in payload) + "\n"
+    return indent + payload + "\n"
+
+
+def apply_script_patches(contents: str, patches: list[ScriptPatch]) -> str:
+    """Injects any number of payloads into a GDScript file in a single pass over its lines.
+
+    Each patch is anchored to the first line that reads exactly like its anchor once leading tabs are ignored. Every
+    anchor is looked up in one table as the file is scanned, so the cost doesn't grow with the number of patches.
+    Patches sharing an anchor are applied in the order they were given.
+
+    Args:
+        contents: The file's contents.
+        patches: The patches to apply to it.
+
+    Returns:
+        The patched file contents.
+
+    Raises:
+        AnchorNotFoundException: An anchor doesn't appear in the file.
+    """
+    anchors = {}
+    for patch in patches:
+        anchors.setdefault(patch.anchor, []).append(patch)
+    lines = []
+    for line in contents.splitlines(keepends=True):
+        if (anchored := anchors.pop(line.strip("\t\n"), None)) is None:
+            lines.append(line)
+            continue
+        indent = line[:len(line) - len(line.lstrip("\t"))]
+        payloads = {"before": [], "at": [], "after": []}
+        for patch in anchored:
+            payloads[patch.position or "after"].append(render_payload(patch.payload,
+                                                                      indent if patch.match_indent else ""))
+        lines.extend(payloads["before"])
+        lines.extend(payloads["at"] or [line])
+        lines.extend(payloads["after"])
+    if anchors:
+        missing = ", ".join(f"`{anchor}`" for anchor in anchors)
+        raise AnchorNotFoundException(f"`{patches[0].path}` has no line matching {missing}")
+    return "".join(lines)
@@ -0,0 +1,118 @@
+import functools
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import typing
+
+import yaml
+
+from . import files
+from .. import __VERSION__
+
+ENVIRONMENT_CACHE = "environment.json"
+
+
+def _mtime_ns(path: Path) -> typing.Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class Environment:
+    """Where everything DnDGMod works with lives on this machine, resolved lazily and at most once per process.
+
+    Setting up the AppData directory and finding the game are remembered across runs in the AppData cache. The
+    AppData setup is redone when prefs.yaml changes (or DnDGMod is updated), and the game is looked for again when
+    Steam's libraryfolders.vdf changes or the game isn't where it was last found.
+    """
+
+    def __init__(self, logger: logging.Logger = None):
+        self.logger = logger or logging
+        self.lock = threading.RLock()
+        self.cache_path = None
+        self.cache = {}
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path) as f:
+                self.cache = json.load(f)
+        except (OSError, ValueError):
+            self.cache = {}
+
+    def save_cache(self):
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path, "w") as f:
+            json.dump(self.cache, f)
+
+    @functools.cached_property
+    def appdata_directory(self) -> Path:
+        with self.lock:
+            appdata_directory = files.get_appdata_path()
+            self.cache_path = appdata_directory / "cache" / ENVIRONMENT_CACHE
+            self.load_cache()
+            prefs_path = appdata_directory / "prefs.yaml"
+            if ((self.cache.get("prefs") or {}).get("Version") != __VERSION__
+                    or self.cache.get("prefs_mtime_ns") != _mtime_ns(prefs_path)
+                    or not all((appdata_directory / name).exists() for name in ("mods", "src", "dependencies"))):
+                files.get_appdata_directory(logger=self.logger)
+                with open(prefs_path) as f:
+                    self.cache["prefs"] = yaml.safe_load(f)
+                self.cache["prefs_mtime_ns"] = _mtime_ns(prefs_path)
+                self.save_cache()
+            return appdata_directory
+
+    @property
+    def prefs(self) -> dict:
+        """The contents of prefs.yaml."""
+        self.appdata_directory  # noqa: makes sure prefs.yaml exists and has been read
+        return self.cache["prefs"]
+
+    @functools.cached_property
+    def godot_data_directory(self) -> Path:
+        return files.get_godot_data_directory()
+
+    @functools.cached_property
+    def steam_path(self) -> Path:
+        return files.get_steam_install_path()
+
+    @functools.cached_property
+    def pck_path(self) -> Path:
+        """The installed game's DnDG_64.pck."""
+        with self.lock:
+            self.appdata_directory  # noqa: loads the cache
+            library_folders = files.get_library_folders_path()
+            located = self.cache.get("pck") or {}
+            if (located.get("library_folders") == str(library_folders)
+                    and located.get("mtime_ns") == _mtime_ns(library_folders) and Path(located["path"]).exists()):
+                return Path(located["path"])
+            pck_path = files.get_dndg_pck_path(library_folders)
+            self.cache["pck"] = {"library_folders": str(library_folders), "mtime_ns": _mtime_ns(library_folders),
+                                 "path": str(pck_path)}
+            self.save_cache()
+            return pck_path
+
+    @property
+    def exe_path(self) -> Path:
+        return self.pck_path.parent / "DnDG_64.exe"
+
+
+_environment = None
+_environment_lock = threading.Lock()
+
+
+def get_environment(logger: logging.Logger = None) -> Environment:
+    """Returns this process's Environment, creating it on first use.
+
+    Args:
+        logger: The logger to report to while anything still left to resolve is resolved.
+    """
+    global _environment
+    with _environment_lock:
+        if _environment is None:
+            _environment = Environment(logger)
+        elif logger:
+            _environment.logger = logger
+        return _environment
@@ -16,3 +16,39 @@ class InvalidModYamlException(DnDGModException):
 
 class InvalidCardsYamlException(DnDGModException):
     """Raised when attempting to parse a cards.yaml file but something seems incorrect."""
+
+
+class InvalidEncountersYamlException(DnDGModException):
+    """Raised when attempting to parse an encounters.yaml file but something seems incorrect."""
+
+
+class InvalidDecksYamlException(DnDGModException):
+    """Raised when attempting to parse a decks.yaml file but something seems incorrect."""
+
+
+class InvalidPckException(DnDGModException):
+    """Raised when attempting to read a .pck file but it doesn't appear to be a Godot 3 resource pack."""
+
+
+class UnpackableFileException(DnDGModException):
+    """Raised when a patched file can't be added to a .pck without exporting the whole project with Godot."""
+
+
+class InvalidTresException(DnDGModException):
+    """Raised when a .tres file being patched isn't laid out the way Godot 3 writes text resources."""
+
+
+class AnchorNotFoundException(DnDGModException):
+    """Raised when the line a script patch is anchored to, or the text a rewrite replaces, isn't in the file."""
+
+
+class GDScriptLiteralException(DnDGModException):
+    """Raised when a dictionary or array in a GDScript file can't be found or parsed."""
+
+
+class DownloadException(DnDGModException):
+    """Raised when a file can't be downloaded, or doesn't match the checksum it was expected to have."""
+
+
+class PackagingException(DnDGModException):
+    """Raised when a mod can't be written to a DnDGMod ZIP Package."""
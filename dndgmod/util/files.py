@@ -1,43 +1,51 @@
 import logging
 
-import wget
 import shutil
 
 import re
 from pathlib import Path
-import winreg
 import os
-from zipfile import ZipFile
 
 import yaml
 
+from dndgmod.util.dependencies import DEPENDENCIES_MIRROR, DependencyInstaller
 from dndgmod.util.exceptions import DnDGNotFoundException
 
 from dndgmod import __VERSION__
 
 
 def get_steam_install_path() -> Path:
+    import winreg  # only exists on Windows, imported here so the rest of DnDGMod can be imported anywhere
+
     key = winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, "SOFTWARE\\Wow6432Node\\Valve\\Steam")
     return Path(winreg.QueryValueEx(key, "InstallPath")[0])
 
 
-def get_dndg_pck_path() -> Path:
+def get_library_folders_path() -> Path:
+    """Locates Steam's libraryfolders.vdf, which lists every Steam library."""
+    if not (library_folders := Path("C:/Program Files (x86)/Steam/steamapps/libraryfolders.vdf")).exists():
+        library_folders = get_steam_install_path() / "steamapps" / "libraryfolders.vdf"
+    return library_folders
+
+
+def get_dndg_pck_path(library_folders: Path = None) -> Path:
     """Locates where D&DG is installed.
 
-    Scans for Steam's libraryfolders.vdf, parses it to find the locations of all Steam libraries, then scans each
-    library until Dungeons & Degenerate Gamblers is found and finally returns the path to DnDG_64.pck.
+    Parses Steam's libraryfolders.vdf to find the locations of all Steam libraries, then scans each library until
+    Dungeons & Degenerate Gamblers is found and finally returns the path to DnDG_64.pck. Prefer
+    `Environment.pck_path`, which remembers the result.
+
+    Args:
+        library_folders: The path to libraryfolders.vdf, if already known.
 
     Returns:
         The path to DnDG_64.pck
     """
-    if not (library_folders := Path("C:/Program Files (x86)/Steam/steamapps/libraryfolders.vdf")).exists():
-        library_folders = get_steam_install_path() / "steamapps" / "libraryfolders.vdf"
-    with open(library_folders) as f:
+    with open(library_folders or get_library_folders_path()) as f:
         matches = re.finditer("\"path\"\t\t\"(.*?)\"", f.read())
     for match in matches:
-        library = (Path(match.groups()[0]) / "steamapps" / "common").resolve(strict=True)
+        library = Path(match.groups()[0]) / "steamapps" / "common"
         dndg_path = library / "Dungeons & Degenerate Gamblers" / "DnDG_64.pck"
-        print(dndg_path)
         if dndg_path.exists():
             return dndg_path
     else:
@@ -49,11 +57,17 @@ def get_godot_data_directory() -> Path:
     return Path(os.getenv("APPDATA")) / "Godot"
 
 
+def get_appdata_path() -> Path:
+    return Path(os.getenv("LOCALAPPDATA")) / "TotallyNotSeth" / "DnDGMod"
+
+
 def get_appdata_directory(logger: logging.Logger = None) -> Path:
+    """Sets up DnDGMod's AppData directory, downloading dependencies if needed. Prefer
+    `Environment.appdata_directory`, which only does this once."""
     if not logger:
         logger = logging
 
-    appdata_directory = Path(os.getenv("LOCALAPPDATA")) / "TotallyNotSeth" / "DnDGMod"
+    appdata_directory = get_appdata_path()
     if not appdata_directory.exists():
         appdata_directory.mkdir(parents=True)
     (appdata_directory / "mods").mkdir(exist_ok=True)
@@ -71,29 +85,34 @@ def get_appdata_directory(logger: logging.Logger = None) -> Path:
         logger.info("Filesystem Upgrade Complete")
     with open(appdata_directory / "prefs.yaml") as f:
         prefs = yaml.safe_load(f)
-    if prefs["Version"] != __VERSION__:
-        logger.info("Updating dependencies...")
-        shutil.rmtree(dependencies_directory, ignore_errors=True)
+    if prefs["Version"] != __VERSION__ or not dependencies_directory.exists():
+        if dependencies_directory.exists():
+            logger.info("Updating dependencies...")
+        else:
+            logger.warning("Downloading new dependencies... this may take awhile")
+        DependencyInstaller(dependencies_directory, get_cache_directory(appdata_directory, "downloads"),
+                            prefs.get("DependenciesMirror") or DEPENDENCIES_MIRROR, logger).install()
+        prefs["Version"] = __VERSION__
         with open(appdata_directory / "prefs.yaml", "w") as f:
-            f.write(f"Version: {__VERSION__}")
-    if not dependencies_directory.exists():
-        logger.warning("Downloading new dependencies... this may take awhile")
-        logger.info("Creating dependency destination directory")
-        dependencies_directory.mkdir()
-        logger.info("Downloading dependencies ZIP from S3 server")
-        wget.download("https://dndgmod.s3.us-east-2.amazonaws.com/dndgmod_dependencies.zip",
-                      str(dependencies_directory / "dndgmod_dependencies.zip"))
-        logger.info("Extracting dependencies ZIP to destination directory")
-        with ZipFile(dependencies_directory / "dndgmod_dependencies.zip") as zip_file:
-            for file in zip_file.namelist():
-                logger.info(f"Extracting {file}")
-                zip_file.extract(file, dependencies_directory)
-        logger.info("Deleting dependencies ZIP")
-        (dependencies_directory / "dndgmod_dependencies.zip").unlink()
-        logger.info("Dependency acquisition completed!")
+            yaml.safe_dump(prefs, f)
     return appdata_directory
 
 
+def get_cache_directory(appdata_directory: Path, name: str) -> Path:
+    """Returns a named cache directory inside DnDGMod's AppData directory, creating it if needed.
+
+    Args:
+        appdata_directory: DnDGMod's AppData directory.
+        name: The name of the cache.
+
+    Returns:
+        The path to the cache directory.
+    """
+    cache_directory = appdata_directory / "cache" / name
+    cache_directory.mkdir(parents=True, exist_ok=True)
+    return cache_directory
+
+
 def replace_in_file(file: Path, old: str, new: str):
     """Performs a string replacement within a file.
 
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import typing
+
+CHUNK_SIZE = 32 << 20
+BLOCK_SIZE = 1 << 20
+
+
+def _hash_chunk(path: Path, offset: int) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        remaining = CHUNK_SIZE
+        while remaining and (block := f.read(min(remaining, BLOCK_SIZE))):
+            digest.update(block)
+            remaining -= len(block)
+    return digest.digest()
+
+
+def hash_file_chunked(path: Path, size: int) -> str:
+    """Hashes a large file in fixed-size chunks on several threads at once.
+
+    hashlib releases the GIL while hashing, so the chunks really are hashed in parallel. The result is the SHA-256 of
+    the concatenated chunk digests, not of the file itself.
+    """
+    with ThreadPoolExecutor() as executor:
+        chunk_digests = executor.map(lambda offset: _hash_chunk(path, offset), range(0, max(size, 1), CHUNK_SIZE))
+        return hashlib.sha256(b"".join(chunk_digests)).hexdigest()
+
+
+def fingerprint(path: Path, known: typing.Iterable[dict] = ()) -> dict:
+    """Fingerprints a file by its size, modification time and contents.
+
+    Args:
+        path: The file to fingerprint.
+        known: Earlier fingerprints of the file. If one of them has the same size and modification time, its hash is
+            reused instead of hashing the file again.
+
+    Returns:
+        `{"size": ..., "mtime_ns": ..., "sha256": ...}`
+    """
+    stat = os.stat(path)
+    for previous in known:
+        if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+            return previous
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": hash_file_chunked(path, stat.st_size)}
+
+
+def fingerprint_files(paths: dict[str, Path], known: typing.Iterable[dict] = ()) -> dict:
+    """Fingerprints several files at once, e.g. `{"pck": ..., "exe": ...}`, reusing hashes from earlier sets."""
+    known = list(known)
+    return {name: fingerprint(path, (previous.get(name) for previous in known)) for name, path in paths.items()}
+
+
+def same_contents(a: dict, b: dict) -> bool:
+    """Returns whether two fingerprints (or two mappings of fingerprints) describe identical files."""
+    if not a or not b:
+        return False
+    if "sha256" not in a:
+        return a.keys() == b.keys() and all(same_contents(a[key], b[key]) for key in a)
+    return a["size"] == b["size"] and a["sha256"] == b["sha256"]
+
+
+def load_fingerprints(path: Path) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_fingerprints(path: Path, fingerprints: dict):
+    with open(path, "w") as f:
+        json.dump(fingerprints, f)
@@ -0,0 +1,163 @@
+from collections import defaultdict, namedtuple
+import re
+
+from .exceptions import GDScriptLiteralException
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<string>"""[\s\S]*?"""|"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+    |(?P<comment>\#[^\n]*)
+    |(?P<declaration>^(?:var|const)[ \t]+(?P<name>\w+)[ \t]*(?::[ \t]*\w*[ \t]*)?=[ \t]*(?=[\[{]))
+    |(?P<open>[\[{(])
+    |(?P<close>[\]})])
+    |(?P<separator>[,:=])
+''', re.MULTILINE | re.VERBOSE)
+BRACKETS = {"[": "]", "{": "}", "(": ")"}
+
+# `keys` holds the source of each key of a dictionary, or of each element of an array. `insert_at` is the end of the
+# line the last element (and its trailing comma, if any) ends on, and `comma_at` is where the last element is missing
+# its comma, if it is
+Literal = namedtuple("Literal", "name kind start end keys insert_at comma_at")
+
+
+def _content_end(contents: str, start: int, end: int, comments: list[tuple[int, int]]) -> int:
+    """Finds the end of the last code (rather than whitespace or comments) in `contents[start:end]`."""
+    while True:
+        end = start + len(contents[start:end].rstrip())
+        while comments and comments[-1][0] >= end:
+            comments.pop()
+        if comments and comments[-1][1] == end:
+            end = comments.pop()[0]
+            continue
+        return end
+
+
+def _source(contents: str, start: int, end: int) -> str:
+    """Returns the code in `contents[start:end]`, without the whitespace and comment lines around it."""
+    source = contents[start:end].strip()
+    while source.startswith("#"):
+        source = source.partition("\n")[2].strip()
+    return source
+
+
+def _end_of_line(contents: str, position: int, end: int) -> int:
+    return line_end if (line_end := contents.find("\n", position, end)) != -1 else position
+
+
+def parse_literals(contents: str) -> dict[str, Literal]:
+    """Finds every top-level `var x = {...}` / `var x = [...]` declaration in a GDScript file in one pass.
+
+    Only the top level of each literal is parsed: nested values are skipped over, taking strings and comments into
+    account, so a declaration costs no more than scanning it.
+
+    Returns:
+        The literals by name. If a name is declared twice, the first declaration wins.
+
+    Raises:
+        GDScriptLiteralException: A literal's brackets don't match.
+    """
+    literals = {}
+    stack = []
+    pending_name = literal = None
+    element_start = key_end = last_comma = None
+    keys, comments = [], []
+    for token in TOKEN_PATTERN.finditer(contents):
+        kind = token.lastgroup
+        if kind == "declaration":
+            if not stack:
+                pending_name = token.group("name")
+        elif kind == "comment":
+            if literal is not None and len(stack) == 1:
+                comments.append(token.span())
+        elif kind == "open":
+            if not stack and pending_name is not None:
+                literal = (pending_name, token.group(), token.start())
+                element_start, key_end, last_comma, keys, comments = token.end(), None, None, [], []
+            stack.append(token.group())
+            pending_name = None
+        elif kind == "close":
+            if not stack or BRACKETS[stack.pop()] != token.group():
+                line = contents.count("\n", 0, token.start()) + 1
+                raise GDScriptLiteralException(f"Unmatched `{token.group()}` on line {line}")
+            if not stack and literal is not None:
+                name, bracket, start = literal
+                end = _content_end(contents, element_start, token.start(), comments)
+                if end > element_start:
+                    keys.append(_source(contents, element_start, key_end or end))
+                    comma_at = end
+                else:
+                    comma_at, end = None, last_comma + 1 if last_comma is not None else start + 1
+                kind_name = "dictionary" if bracket == "{" else "array"
+                literals.setdefault(name, Literal(name, kind_name, start, token.start(), keys,
+                                                  _end_of_line(contents, end, token.start()), comma_at))
+                literal = None
+        elif kind == "separator" and literal is not None and len(stack) == 1:
+            if token.group() == ",":
+                if _content_end(contents, element_start, token.start(), comments) > element_start:
+                    keys.append(_source(contents, element_start, key_end or token.start()))
+                element_start, key_end, last_comma, comments = token.end(), None, token.start(), []
+            elif key_end is None and literal[1] == "{":
+                key_end = token.start()
+    if stack:
+        raise GDScriptLiteralException(f"Unclosed `{stack[-1]}` at the end of the file")
+    return literals
+
+
+class LiteralEditor:
+    """Appends entries to the top-level dictionaries and arrays of a GDScript file.
+
+    The file is parsed once. Appends are queued against the parsed literals, costing only the size of the entry, and
+    `patch` splices every queued entry in with a single pass over the file. Entries are added after a literal's last
+    element, adding the comma it needs, so nothing depends on how the file's closing brackets are spaced.
+    """
+
+    def __init__(self, contents: str):
+        self.contents = contents
+        self.literals = parse_literals(contents)
+        self.additions = defaultdict(list)
+
+    def __getitem__(self, name: str) -> Literal:
+        try:
+            return self.literals[name]
+        except KeyError:
+            raise GDScriptLiteralException(f"The script declares no dictionary or array named `{name}`") from None
+
+    def dictionary(self, name: str) -> str:
+        """Returns `name` if the script declares a dictionary by that name, or else the name of its last top-level
+        dictionary, which is the one the game's registries have always been appended to.
+
+        Raises:
+            GDScriptLiteralException: The script declares no dictionaries at all.
+        """
+        if name in self.literals and self.literals[name].kind == "dictionary":
+            return name
+        dictionaries = [literal for literal in self.literals.values() if literal.kind == "dictionary"]
+        if not dictionaries:
+            raise GDScriptLiteralException(f"The script declares no dictionary named `{name}`, or any other")
+        return max(dictionaries, key=lambda literal: literal.start).name
+
+    def append(self, name: str, entry: str):
+        """Queues an entry (e.g. `"313": {...}` or `ForestRooms.ENCOUNTER_GOBLIN`) to be appended to a literal."""
+        self.additions[self[name].insert_at].append(entry.rstrip())
+
+    def patch(self) -> str:
+        """Returns the file's contents with every queued entry appended."""
+        comma_at = {literal.insert_at: literal.comma_at for literal in self.literals.values()}
+        pieces = []
+        position = 0
+        for offset in sorted(self.additions):
+            entries = self.additions[offset]
+            if comma_at[offset] is not None:
+                pieces += [self.contents[position:comma_at[offset]], ","]
+                position = comma_at[offset]
+            pieces.append(self.contents[position:offset])
+            for i, entry in enumerate(entries):
+                pieces.append("\n" + entry if i == len(entries) - 1 or entry.endswith(",") else f"\n{entry},")
+            position = offset
+        pieces.append(self.contents[position:])
+        return "".join(pieces)
+
+
+def numeric_keys(literal: Literal) -> list[int]:
+    """Returns the keys of a dictionary like CardList's `card_list` that are quoted numbers (e.g. `"042"`)."""
+    return [int(key[1:-1]) for key in literal.keys
+            if len(key) > 2 and key[0] == key[-1] == '"' and key[1:-1].isdigit()]
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import shutil
+
+IMPORT_DIRECTORY = ".import"
+
+
+def imported_prefix(path: str) -> str:
+    """Returns the prefix Godot 3 gives every file it imports from an asset into the `.import` directory.
+
+    Args:
+        path: The asset's POSIX-style path relative to the project.
+    """
+    name = path.rsplit("/", 1)[-1]
+    return f"{name}-{hashlib.md5(f'res://{path}'.encode()).hexdigest()}."
+
+
+class ImportCache:
+    """Keeps Godot's `.import` directory alive while modified_src is rebuilt.
+
+    The directory is moved out of the project before it is wiped and moved back once patching is done, so Godot only
+    has to reimport the assets whose contents actually changed. Both moves are renames within the AppData directory.
+    """
+
+    def __init__(self, cache_directory: Path):
+        self.cache_directory = cache_directory
+        self.stash_path = cache_directory / IMPORT_DIRECTORY
+        self.assets_path = cache_directory / "assets.json"
+
+    def stash(self, project: Path):
+        """Moves a project's `.import` directory into the cache, replacing whatever was stashed before."""
+        if not (project / IMPORT_DIRECTORY).exists():
+            return
+        if self.stash_path.exists():
+            shutil.rmtree(self.stash_path)
+        os.replace(project / IMPORT_DIRECTORY, self.stash_path)
+
+    def restore(self, project: Path, assets: dict[str, str]) -> list[str]:
+        """Moves the stashed `.import` directory back into a project and drops entries for assets that changed.
+
+        Args:
+            project: The Godot project to restore the cache into.
+            assets: A mapping of each importable asset's POSIX-style path to the SHA-256 digest of its contents.
+
+        Returns:
+            The assets whose imported files were invalidated.
+        """
+        import_directory = project / IMPORT_DIRECTORY
+        import_directory.mkdir(exist_ok=True)
+        if self.stash_path.exists():
+            for entry in os.scandir(self.stash_path):
+                os.replace(entry.path, import_directory / entry.name)
+            shutil.rmtree(self.stash_path)
+
+        try:
+            with open(self.assets_path) as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = {}
+        stale = sorted(path for path in previous.keys() | assets.keys() if previous.get(path) != assets.get(path))
+        prefixes = tuple(imported_prefix(path) for path in stale)
+        if prefixes:
+            for entry in os.scandir(import_directory):
+                if entry.name.startswith(prefixes):
+                    os.unlink(entry.path)
+
+        with open(self.assets_path, "w") as f:
+            json.dump(assets, f)
+        return stale
@@ -0,0 +1,185 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path, PurePosixPath
+import shutil
+import stat
+import typing
+import zipfile
+
+from .dependencies import swap_directory
+from .exceptions import InvalidDnDGModZIPPackageFormatException
+from .packaging import BLOCK_SIZE, PACKAGE_MANIFEST, PACKAGE_VERSION
+
+MAX_PACKAGE_SIZE = 1 << 30  # uncompressed
+MAX_PACKAGE_FILES = 20000
+# members that inflate by more than this (and to more than a few MiB) are treated as ZIP bombs
+MAX_COMPRESSION_RATIO = 200
+MIN_RATIO_CHECKED_SIZE = 4 << 20
+
+# `members` maps each ZIP member to extract to its path relative to the mod's directory, and `hashes` holds the
+# SHA-256 of each of those paths if the package has a manifest
+InstallPlan = namedtuple("InstallPlan", "prefix members hashes")
+
+
+def mod_name(zip_path: Path) -> str:
+    """Returns the name of the mod directory a package installs to, i.e. its file name without `.zip`."""
+    return zip_path.stem if zip_path.suffix.lower() == ".zip" else zip_path.name
+
+
+def _relative_path(zip_path: Path, info: zipfile.ZipInfo, prefix: str) -> str:
+    """Returns where a member goes relative to the mod's directory, rejecting anything that would land outside it."""
+    path = info.filename[len(prefix):]
+    parts = PurePosixPath(path).parts
+    if ("\\" in path or path.startswith("/") or not parts or ":" in parts[0]
+            or any(part in (".", "..") for part in path.split("/"))):
+        raise InvalidDnDGModZIPPackageFormatException(f"{zip_path} contains an unsafe path `{info.filename}`")
+    if stat.S_ISLNK(info.external_attr >> 16):
+        raise InvalidDnDGModZIPPackageFormatException(f"{zip_path} contains a symlink `{info.filename}`")
+    return "/".join(parts)
+
+
+def plan_install(zip_path: Path, archive: zipfile.ZipFile) -> InstallPlan:
+    """Validates a package before anything is written, working out which members to extract where.
+
+    A package holds a mod either at its root or inside a single top-level folder, whose name is stripped from every
+    path so the mod extracts straight into its final layout. Anything outside that folder (e.g. `__MACOSX`) is ignored.
+
+    Raises:
+        InvalidDnDGModZIPPackageFormatException: The package has no mod.yaml, has paths that would be written outside
+            the mod's directory, is too large, or its manifest doesn't match its contents.
+    """
+    infos = [info for info in archive.infolist() if not info.is_dir()]
+    names = {info.filename for info in infos}
+    if "mod.yaml" in names:
+        prefix = ""
+    elif len(candidates := [name for name in names if name.count("/") == 1 and name.endswith("/mod.yaml")]) == 1:
+        prefix = candidates[0].removesuffix("mod.yaml")
+    else:
+        raise InvalidDnDGModZIPPackageFormatException(f"{zip_path} has no mod.yaml, either at its root or in a single "
+                                                      f"top-level folder")
+
+    members = {}
+    total_size = 0
+    for info in infos:
+        if not info.filename.startswith(prefix) or (not prefix and info.filename == PACKAGE_MANIFEST):
+            continue
+        members[info.filename] = _relative_path(zip_path, info, prefix)
+        total_size += info.file_size
+        if (info.file_size > MIN_RATIO_CHECKED_SIZE
+                and info.file_size > MAX_COMPRESSION_RATIO * max(info.compress_size, 1)):
+            raise InvalidDnDGModZIPPackageFormatException(f"`{info.filename}` in {zip_path} is suspiciously "
+                                                          f"compressible")
+    if total_size > MAX_PACKAGE_SIZE or len(members) > MAX_PACKAGE_FILES:
+        raise InvalidDnDGModZIPPackageFormatException(f"{zip_path} is too large ({len(members)} files, "
+                                                      f"{total_size} bytes uncompressed)")
+    if len(set(members.values())) != len(members):
+        raise InvalidDnDGModZIPPackageFormatException(f"{zip_path} contains the same path more than once")
+
+    hashes = {}
+    if not prefix and PACKAGE_MANIFEST in names:
+        try:
+            manifest = json.loads(archive.read(PACKAGE_MANIFEST))
+        except ValueError as e:
+            raise InvalidDnDGModZIPPackageFormatException(f"{zip_path} has an unreadable manifest: {e}") from e
+        if manifest.get("version") == PACKAGE_VERSION:
+            hashes = manifest["files"]
+            if set(hashes) != set(members.values()):
+                raise InvalidDnDGModZIPPackageFormatException(f"{zip_path}'s contents don't match its manifest")
+    return InstallPlan(prefix, members, hashes)
+
+
+def _extract(zip_path: Path, archive: zipfile.ZipFile, plan: InstallPlan, destination: Path):
+    created = set()
+    for member, path in plan.members.items():
+        target = destination / path
+        if target.parent not in created:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            created.add(target.parent)
+        digest = hashlib.sha256()
+        with archive.open(member) as source, open(target, "wb") as f:
+            while block := source.read(BLOCK_SIZE):
+                digest.update(block)
+                f.write(block)
+        if path in plan.hashes and digest.hexdigest() != plan.hashes[path]:
+            raise InvalidDnDGModZIPPackageFormatException(f"`{member}` in {zip_path} doesn't match its manifest")
+
+
+def install_mod(zip_path: Path, mod_directory: Path, staging_directory: Path,
+                logger: logging.Logger = None) -> InstallPlan:
+    """Installs a DnDGMod ZIP Package, replacing any installed mod of the same name.
+
+    The package is validated first, then extracted into `staging_directory` and swapped into place with renames, so
+    the installed mod is never left half-replaced. `staging_directory` must be on the same drive as `mod_directory`,
+    but not inside the mods directory, or a leftover staging directory would be loaded as a mod.
+
+    Raises:
+        InvalidDnDGModZIPPackageFormatException: The package isn't a valid ZIP, failed validation, or is corrupt.
+    """
+    if not logger:
+        logger = logging
+    new = staging_directory / f"{mod_directory.name}.new"
+    old = staging_directory / f"{mod_directory.name}.old"
+    if not mod_directory.exists() and old.exists():
+        # an earlier swap was interrupted between its renames
+        os.replace(old, mod_directory)
+    shutil.rmtree(new, ignore_errors=True)
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            plan = plan_install(zip_path, archive)
+            logger.info(f"Extracting {len(plan.members)} files from {zip_path} to {mod_directory}")
+            _extract(zip_path, archive, plan, new)
+        new.mkdir(parents=True, exist_ok=True)
+        swap_directory(new, mod_directory, old)
+    except zipfile.BadZipFile as e:
+        raise InvalidDnDGModZIPPackageFormatException(f"{zip_path} is corrupt: {e}") from e
+    finally:
+        shutil.rmtree(new, ignore_errors=True)
+    return plan
+
+
+def install_mods(zip_paths: typing.Iterable[Path], mods_directory: Path, staging_directory: Path,
+                 logger: logging.Logger = None, workers: int = None) -> dict[Path, typing.Optional[Path]]:
+    """Installs many DnDGMod ZIP Packages at once, each on its own thread.
+
+    Packages that are invalid or can't be read or extracted are reported and skipped without affecting the rest. If
+    several packages install to the same mod directory, only the last one is installed.
+
+    Args:
+        zip_paths: The packages to install.
+        mods_directory: The mods directory to install them to.
+        staging_directory: Where to extract packages before swapping them into place. See `install_mod`.
+        logger: The logger to report progress to.
+        workers: How many packages to install at once. Defaults to `ThreadPoolExecutor`'s default.
+
+    Returns:
+        Where each package was installed to, or None if it was invalid or skipped.
+    """
+    if not logger:
+        logger = logging
+    results = {}
+    by_name = {}
+    for zip_path in zip_paths:
+        if (name := mod_name(zip_path)) in by_name:
+            logger.warning(f"{by_name[name]} and {zip_path} both install `{name}`, only installing {zip_path}")
+            results[by_name[name]] = None
+        by_name[name] = zip_path
+
+    def install(name: str) -> typing.Optional[Path]:
+        try:
+            install_mod(by_name[name], mods_directory / name, staging_directory, logger)
+        except InvalidDnDGModZIPPackageFormatException as e:
+            logger.error(f"{by_name[name]} Has An Invalid DnDGMod ZIP Package Format: {e}")
+            return None
+        except OSError as e:
+            # e.g. the package is missing or locked, or the disk is full
+            logger.error(f"Couldn't install {by_name[name]}: {e}")
+            return None
+        return mods_directory / name
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results.update(zip(by_name.values(), executor.map(install, by_name)))
+    return results
@@ -20,3 +20,25 @@ def logger_setup(ctx, log_level):
     logger.setLevel(LOG_LEVEL_MAPPING[log_level.value])
     logger.addHandler(logging.StreamHandler())
     ctx.obj["logger"] = logger
+
+
+class RecordingLogger:
+    """Collects log messages so they can be replayed through another logger later, e.g. from a worker process."""
+
+    def __init__(self):
+        self.records = []
+
+    def log(self, level, msg):
+        self.records.append((level, msg))
+
+    def debug(self, msg):
+        self.log(logging.DEBUG, msg)
+
+    def info(self, msg):
+        self.log(logging.INFO, msg)
+
+    def warning(self, msg):
+        self.log(logging.WARNING, msg)
+
+    def error(self, msg):
+        self.log(logging.ERROR, msg)
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+
+
+def hash_file(path: Path) -> str:
+    """Computes the SHA-256 digest of a file without loading it into memory at once.
+
+    Args:
+        path: The file to hash.
+
+    Returns:
+        The hex digest of the file's contents.
+    """
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def scan_tree(root: Path, exclude: tuple[str, ...] = ()) -> dict[str, list[int]]:
+    """Stats every file below a directory.
+
+    Args:
+        root: The directory to scan.
+        exclude: Top-level directory names to skip (e.g. Godot's `.import` cache).
+
+    Returns:
+        A mapping of POSIX-style relative paths to `[size, mtime_ns]`.
+    """
+    tree = {}
+    if not root.exists():
+        return tree
+    for directory, dirnames, filenames in os.walk(root):
+        relative_directory = Path(directory).relative_to(root)
+        if relative_directory == Path("."):
+            dirnames[:] = [dirname for dirname in dirnames if dirname not in exclude]
+        for filename in filenames:
+            stat = os.stat(os.path.join(directory, filename))
+            tree[(relative_directory / filename).as_posix()] = [stat.st_size, stat.st_mtime_ns]
+    return tree
+
+
+def hash_tree(root: Path, previous: dict[str, list] = None, exclude: tuple[str, ...] = ()) -> dict[str, list]:
+    """Hashes every file below a directory, reusing digests for files whose size and mtime haven't changed.
+
+    Args:
+        root: The directory to hash.
+        previous: The result of an earlier `hash_tree` call on the same directory, if any.
+        exclude: Top-level directory names to skip.
+
+    Returns:
+        A mapping of POSIX-style relative paths to `[size, mtime_ns, sha256]`.
+    """
+    previous = previous or {}
+    tree = {}
+    for path, stat in scan_tree(root, exclude).items():
+        if (old := previous.get(path)) and old[:2] == stat:
+            tree[path] = old
+        else:
+            tree[path] = stat + [hash_file(root / path)]
+    return tree
+
+
+def digests(tree: dict[str, list]) -> dict[str, str]:
+    """Strips the stat information from a `hash_tree` result, leaving only the content digests."""
+    return {path: entry[2] for path, entry in tree.items()}
+
+
+class PatchManifest:
+    """Records what the last patch run was built from and what it wrote.
+
+    Stored as JSON next to `modified_src`. The manifest is deleted before `modified_src` is touched and only written
+    back once a patch run completes, so an interrupted run always forces a full rebuild next time.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.vanilla = {}
+        self.inputs = {}
+        self.written = []
+        self.tree = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "PatchManifest":
+        manifest = cls(path)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return manifest
+        if data.get("version") != MANIFEST_VERSION:
+            return manifest
+        manifest.vanilla = data["vanilla"]
+        manifest.inputs = data["inputs"]
+        manifest.written = data["written"]
+        manifest.tree = data["tree"]
+        return manifest
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.vanilla) and bool(self.tree)
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "vanilla": self.vanilla,
+                "inputs": self.inputs,
+                "written": self.written,
+                "tree": self.tree,
+            }, f)
+
+    def invalidate(self):
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,199 @@
+from collections import namedtuple
+import copy
+import os
+from pathlib import Path
+import pickle
+
+import yaml
+
+from . import exceptions
+
+# libyaml's loader is several times faster than the pure-Python one, but isn't available in every PyYAML build
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+CACHE_VERSION = 2
+EXPORTS = ["cards", "decks", "encounters"]
+
+Mod = namedtuple("Mod", "path metadata cards decks encounters")
+
+
+def normalise_key(key):
+    """Lower-cases and underscores a YAML key, so `Chip Reward`, `chip reward` and `chip_reward` are all the same."""
+    if isinstance(key, str):
+        return key.lower().strip().replace(" ", "_")
+    return key
+
+
+class KeyNormalisingLoader(YAML_LOADER):
+    """A safe YAML loader that normalises mapping keys while the document is being constructed.
+
+    Keys are normalised in every mapping from `normalise_from` levels deep, and in any mapping nested directly inside
+    one of those. Mappings inside lists are left alone.
+    """
+    normalise_from = 0
+
+    def construct_document(self, node):
+        self.normalised_mappings = set()
+        pending, seen = [(node, 0)], set()
+        while pending:
+            mapping_node, depth = pending.pop()
+            if not isinstance(mapping_node, yaml.MappingNode) or id(mapping_node) in seen:
+                continue
+            seen.add(id(mapping_node))
+            if depth >= self.normalise_from:
+                self.normalised_mappings.add(id(mapping_node))
+            pending.extend((value_node, depth + 1) for _, value_node in mapping_node.value)
+        return super().construct_document(node)
+
+    def construct_yaml_map(self, node):
+        data = {}
+        yield data
+        mapping = self.construct_mapping(node)
+        if id(node) in self.normalised_mappings:
+            data.update((normalise_key(key), value) for key, value in mapping.items())
+        else:
+            data.update(mapping)
+
+
+KeyNormalisingLoader.add_constructor("tag:yaml.org,2002:map", KeyNormalisingLoader.construct_yaml_map)
+
+
+class ExportLoader(KeyNormalisingLoader):
+    """Loads an export file (cards.yaml, decks.yaml, encounters.yaml), whose top-level keys are entry names."""
+    normalise_from = 1
+
+
+def load_yaml(path: Path, loader: type = KeyNormalisingLoader):
+    with open(path) as f:
+        return yaml.load(f, Loader=loader)
+
+
+class ModEntry:
+    """An entry exported by a mod, validated once when it is loaded.
+
+    Subclasses list the properties they read in `__slots__`, the ones that must be present in `required`, and default
+    values for the rest in `defaults` (anything not listed there defaults to None).
+    """
+    __slots__ = ("name",)
+    required = ()
+    defaults = {}
+    kind = "Entry"
+    exception = exceptions.DnDGModException
+
+    def __init__(self, name: str, data: dict):
+        if not isinstance(data, dict):
+            raise self.exception(f"{self.kind} `{name}` should be a set of properties, not `{data}`")
+        missing = [field for field in self.required if field not in data]
+        if missing:
+            fields = ", ".join(f"`{field}`" for field in missing)
+            raise self.exception(f"{self.kind} `{name}` is missing the required {fields} "
+                                 f"propert{'ies' if len(missing) > 1 else 'y'}")
+        self.name = name
+        for field in self.__slots__:
+            # defaults are copied so entries never share a mutable default like `triggers`
+            setattr(self, field, data[field] if field in data else copy.copy(self.defaults.get(field)))
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Card(ModEntry):
+    __slots__ = ("value", "description", "suit", "attributes", "flexible", "keywords", "identifier", "image", "foil",
+                 "triggers")
+    required = ("value", "description")
+    defaults = {"suit": "special", "attributes": ("REWARD",), "triggers": {}}
+    kind = "Card"
+    exception = exceptions.InvalidCardsYamlException
+
+
+class Deck(ModEntry):
+    __slots__ = ("cover_card_id", "description", "deck_list")
+    required = ("cover_card_id", "description", "deck_list")
+    kind = "Deck"
+    exception = exceptions.InvalidDecksYamlException
+
+
+class Encounter(ModEntry):
+    __slots__ = ("location", "deck", "chip_reward", "start_dialogue", "end_dialogue", "sprite", "difficulty",
+                 "healthpoints", "hard_deck", "foils", "hard_foils", "modified_stand_point")
+    required = ("location", "deck", "chip_reward", "start_dialogue", "end_dialogue", "sprite")
+    defaults = {"healthpoints": 21}
+    kind = "Encounter"
+    exception = exceptions.InvalidEncountersYamlException
+
+    @property
+    def hard(self) -> bool:
+        return self.difficulty is not None and self.difficulty.lower().strip() == "hard"
+
+
+EXPORT_MODELS = {"cards": Card, "decks": Deck, "encounters": Encounter}
+
+
+class ModLoader:
+    """Loads and validates mods, caching the results between runs.
+
+    Loaded YAML files are cached in a pickle keyed by each file's path, modification time and size, so mods that
+    haven't changed since they were last loaded are never parsed again.
+    """
+
+    def __init__(self, cache_directory: Path):
+        self.cache_path = cache_directory / "mods.pickle"
+        self.cache = {}
+        self.dirty = False
+        try:
+            with open(self.cache_path, "rb") as f:
+                cache = pickle.load(f)
+            if cache["version"] == CACHE_VERSION:
+                self.cache = cache["files"]
+        except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError, AttributeError):
+            pass
+
+    def load_file(self, path: Path, export: str = None):
+        """Loads one of a mod's YAML files.
+
+        Args:
+            path: The YAML file to load.
+            export: The export the file contains (cards, decks or encounters), or None for mod.yaml.
+
+        Returns:
+            The contents of mod.yaml with its keys normalised, or a mapping of names to `Card`, `Deck` or `Encounter`
+            entries for an export.
+        """
+        stat = os.stat(path)
+        key = str(path)
+        if (cached := self.cache.get(key)) and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        if export is None:
+            data = load_yaml(path)
+            if not isinstance(data, dict):
+                raise exceptions.InvalidModYamlException(f"`{path}` should be a set of properties")
+        else:
+            model = EXPORT_MODELS[export]
+            data = {name: model(name, entry) for name, entry in (load_yaml(path, ExportLoader) or {}).items()}
+        self.cache[key] = (stat.st_mtime_ns, stat.st_size, data)
+        self.dirty = True
+        return data
+
+    def load_mod(self, path: Path) -> Mod:
+        """Loads a mod's metadata and every export it declares. Exports the mod doesn't declare are None.
+
+        Raises:
+            InvalidModYamlException: mod.yaml is missing the `Name` or `Exports` property.
+        """
+        metadata = self.load_file(path / "mod.yaml")
+        if "name" not in metadata or "exports" not in metadata:
+            raise exceptions.InvalidModYamlException(f"`{path / 'mod.yaml'}` needs both a `Name` and an `Exports` "
+                                                     f"property")
+        exports = {export: self.load_file(path / f"{export}.yaml", export) if export in metadata["exports"] else None
+                   for export in EXPORTS}
+        return Mod(path=path, metadata=metadata, **exports)
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.cache = {key: value for key, value in self.cache.items() if os.path.exists(key)}
+        temporary_path = self.cache_path.with_suffix(".tmp")
+        with open(temporary_path, "wb") as f:
+            pickle.dump({"version": CACHE_VERSION, "files": self.cache}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.cache_path)
+        self.dirty = False
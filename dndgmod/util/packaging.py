@@ -0,0 +1,185 @@
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import struct
+import tempfile
+import typing
+import zipfile
+import zlib
+
+from .exceptions import PackagingException
+from .manifest import hash_file, scan_tree
+
+PACKAGE_VERSION = 1
+# lists every file in the package and its SHA-256, stored as the package's first member
+PACKAGE_MANIFEST = "dndgmod_package.json"
+# formats that are already compressed, which deflating again would only slow down
+STORED_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".ogg", ".mp3", ".zip"}
+COMPRESSION_LEVEL = 9
+BLOCK_SIZE = 1 << 20
+# compressed members are kept in memory up to this size, and spill over to a temporary file beyond it
+SPOOL_SIZE = 8 << 20
+# how many bytes of files can be waiting to be written at once
+MAX_PENDING_BYTES = 64 << 20
+# every member gets the same timestamp (1980-01-01 00:00, the earliest a ZIP can store) and permissions, so packaging
+# the same files always produces the same bytes
+DOS_DATE, DOS_TIME = (1 << 5) | 1, 0
+EXTERNAL_ATTRIBUTES = 0o100644 << 16
+CREATE_SYSTEM = 3  # Unix, so the permissions above are used
+ZIP_VERSION = 20
+ZIP32_LIMIT = 0xFFFFFFFF
+
+# `data` is the member's data as written to the ZIP: bytes, a file to copy it from, or a (spooled) temporary file
+Member = namedtuple("Member", "name crc size compressed_size compress_type data")
+
+
+def read_package_manifest(zip_path: Path) -> typing.Optional[dict]:
+    """Returns the manifest of a package written by `write_package`, or None if it has none or can't be read."""
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            manifest = json.loads(archive.read(PACKAGE_MANIFEST))
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+    return manifest if isinstance(manifest, dict) and manifest.get("version") == PACKAGE_VERSION else None
+
+
+def _blocks(source: typing.Union[bytes, Path]) -> typing.Iterator[bytes]:
+    if isinstance(source, bytes):
+        yield source
+        return
+    with open(source, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            yield block
+
+
+def compress_member(name: str, source: typing.Union[bytes, Path]) -> Member:
+    """Deflates a file (or some bytes) into a package member.
+
+    Files in an already-compressed format, and files that deflating doesn't make any smaller, are stored as they are,
+    to be copied straight from disk when the member is written. Deflated data spills over to a temporary file once it
+    grows past `SPOOL_SIZE`. zlib releases the GIL while it works, so members can be compressed on a thread pool.
+    """
+    deflate = Path(name).suffix.lower() not in STORED_SUFFIXES
+    crc, size = 0, 0
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    compressed = tempfile.SpooledTemporaryFile(SPOOL_SIZE) if deflate else None
+    for block in _blocks(source):
+        crc = zlib.crc32(block, crc)
+        size += len(block)
+        if deflate:
+            compressed.write(compressor.compress(block))
+    if deflate:
+        compressed.write(compressor.flush())
+        if compressed.tell() < size:
+            return Member(name, crc, size, compressed.tell(), zipfile.ZIP_DEFLATED, compressed)
+        compressed.close()
+    return Member(name, crc, size, size, zipfile.ZIP_STORED, source)
+
+
+class PackageWriter:
+    """Writes a ZIP out of already-compressed members, each going to disk as soon as it is written.
+
+    `zipfile` can only compress members itself, one at a time, so the ZIP's headers are written here instead. Members
+    are written in the order they're given, with fixed timestamps and permissions and no extra fields. Archives are
+    limited to 4 GiB (no ZIP64), which no mod comes near.
+    """
+
+    def __init__(self, f: typing.BinaryIO):
+        self.f = f
+        self.offset = 0
+        self.central_directory = []
+
+    def write(self, member: Member):
+        name = member.name.encode("utf-8")
+        flags = 0 if name.isascii() else 0x800  # the name is UTF-8
+        if max(self.offset, member.size, member.compressed_size) > ZIP32_LIMIT:
+            raise PackagingException("Packages can't be larger than 4 GiB")
+        self.central_directory.append(struct.pack(
+            zipfile.structCentralDir, zipfile.stringCentralDir, ZIP_VERSION, CREATE_SYSTEM, ZIP_VERSION, 0, flags,
+            member.compress_type, DOS_TIME, DOS_DATE, member.crc, member.compressed_size, member.size, len(name), 0, 0,
+            0, 0, EXTERNAL_ATTRIBUTES, self.offset) + name)
+        header = struct.pack(zipfile.structFileHeader, zipfile.stringFileHeader, ZIP_VERSION, 0, flags,
+                             member.compress_type, DOS_TIME, DOS_DATE, member.crc, member.compressed_size, member.size,
+                             len(name), 0)
+        self.f.write(header + name)
+        if isinstance(member.data, bytes):
+            self.f.write(member.data)
+        elif isinstance(member.data, Path):
+            with open(member.data, "rb") as source:
+                remaining = member.size
+                while remaining and (block := source.read(min(remaining, BLOCK_SIZE))):
+                    self.f.write(block)
+                    remaining -= len(block)
+                if remaining or source.read(1):
+                    raise PackagingException(f"`{member.name}` changed while it was being packaged")
+        else:
+            with member.data:
+                member.data.seek(0)
+                shutil.copyfileobj(member.data, self.f, BLOCK_SIZE)
+        self.offset += len(header) + len(name) + member.compressed_size
+
+    def close(self):
+        if len(self.central_directory) > 0xFFFF:
+            raise PackagingException("Packages can't hold more than 65535 files")
+        central_directory = b"".join(self.central_directory)
+        self.f.write(central_directory)
+        self.f.write(struct.pack(zipfile.structEndArchive, zipfile.stringEndArchive, 0, 0,
+                                 len(self.central_directory), len(self.central_directory), len(central_directory),
+                                 self.offset, 0))
+
+
+def write_package(source_directory: Path, zip_path: Path, logger: logging.Logger = None, workers: int = None) -> bool:
+    """Packages a directory into a reproducible DnDGMod ZIP Package.
+
+    Files are compressed on a thread pool and written in sorted order as they're ready. At most `MAX_PENDING_BYTES` of
+    files are in flight at once, and stored files are copied straight from disk, so memory use doesn't grow with the
+    size of the mod. The package starts with a manifest of every file's hash. If `zip_path` already holds a
+    package with the same manifest, it is left alone, since packaging would produce exactly the same bytes.
+
+    Args:
+        source_directory: The directory to package, e.g. a mod's directory.
+        zip_path: Where to write the package. It is replaced once the new package is complete.
+        logger: The logger to report progress to.
+        workers: How many files to compress at once. Defaults to `ThreadPoolExecutor`'s default.
+
+    Returns:
+        Whether the package was written, rather than found to be up to date.
+
+    Raises:
+        PackagingException: The package would be too large for a ZIP.
+    """
+    if not logger:
+        logger = logging
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    sizes = {name: stat[0] for name, stat in scan_tree(source_directory).items() if name != PACKAGE_MANIFEST}
+    names = sorted(sizes)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = dict(zip(names, executor.map(hash_file, (source_directory / name for name in names))))
+        manifest = {"version": PACKAGE_VERSION, "files": hashes}
+        if read_package_manifest(zip_path) == manifest:
+            logger.info(f"{zip_path} is already up to date")
+            return False
+
+        logger.info(f"Packaging {len(names)} files into {zip_path}")
+        temporary_path = zip_path.with_name(zip_path.name + ".tmp")
+        with open(temporary_path, "wb") as f:
+            writer = PackageWriter(f)
+            writer.write(compress_member(PACKAGE_MANIFEST, json.dumps(manifest, indent=1, sort_keys=True).encode()))
+            pending = deque()
+            pending_bytes = 0
+            for name in names:
+                pending.append((executor.submit(compress_member, name, source_directory / name), sizes[name]))
+                pending_bytes += sizes[name]
+                while pending and (pending_bytes > MAX_PENDING_BYTES or len(pending) >= 2 * workers):
+                    future, size = pending.popleft()
+                    writer.write(future.result())
+                    pending_bytes -= size
+            for future, _ in pending:
+                writer.write(future.result())
+            writer.close()
+    os.replace(temporary_path, zip_path)
+    return True
@@ -1,26 +1,51 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import hashlib
 import os
 from pathlib import Path
+import random
 import shutil
 import sys
 import logging
 
 import jinja2
-import yaml
 
 from .spritesheet import CardSpritesheet, OpponentSpritesheet
+from .tres import TresFile
+from .art import ArtPreprocessor, place_files
 from . import files, exceptions
-from ..pregex import room_list
-
-FIRST_CARD = 313
-# new 'globals' needed
-FIRST_DECK = 18
+from .environment import get_environment
+from .blobs import BlobStore, break_link, godot_owned
+from .import_cache import ImportCache
+from .logger import RecordingLogger
+from .edits import EditBuffer, ScriptPatch, apply_script_patches
+from .gdscript import LiteralEditor, numeric_keys
+from .manifest import PatchManifest, digests, hash_file, hash_tree, scan_tree
+from .mods import ModLoader
+from .pck import get_import_path
+from .rewrites import RewriteCache, apply_replacements, load_rewrites
+from .room_list import RoomListPatcher
+from .. import __VERSION__
+
+CARD_LIST = "singletons/CardList.gd"
+DECK_LIST = "singletons/DeckList.gd"
+ROOM_LIST = "singletons/RoomList.gd"
+PORTRAIT_FRAMES = "assets/art/portraits/portrait_spriteframes.tres"
 VALID_TRIGGERS = ["play", "clicked", "bust_limit_exceeded", "stand", "start_of_turn", "sleeve_played",
                   "another_card_drawn", "card_instanced", 'hit', 'discarded', 'click']
 VALID_EXPORTS = ['cards', 'decks', 'encounters']
+ModJob = namedtuple("ModJob", "mod metadata cards decks encounters first_card first_deck first_sprite")
+ModResult = namedtuple("ModResult", "card_list_entries deck_list_entries encounters portraits card_art foil_maps "
+                                    "written_files log")
+BUILTIN_TEMPLATES = ["card_art.png.import.j2", "card_list_entry.j2", "deck_list_entry.j2", "room_list_entry.j2",
+                     "CardEffectXXX.gd.j2", "card_effect_XXX.tres.j2", "on_event.gd.j2", "wait_for.gd.j2"]
+# bumped whenever templates compiled by an earlier version mustn't be reused from the bytecode cache
+TEMPLATE_CACHE_VERSION = 2
 
 
 class Patcher:
-    def __init__(self, logger: logging.Logger = None):
+    def __init__(self, logger: logging.Logger = None, incremental: bool = False, jobs: int = 1,
+                 appdata_directory: Path = None):
         if not logger:
             self.logger = logging
         else:
@@ -34,38 +59,69 @@ class Patcher:
             self.bundle_dir = Path(__file__).parent.parent
         self.logger.debug(f"Bundle Directory: {self.bundle_dir} (frozen = {frozen})")
 
-        self.appdata_directory = files.get_appdata_directory(logger=logger)
+        self.appdata_directory = appdata_directory or get_environment(logger).appdata_directory
         self.logger.debug(f"AppData Directory: {self.appdata_directory}")
         self.vanilla_src = self.appdata_directory / "src"
         self.modified_src = self.appdata_directory / "modified_src"
+        self.blobs = BlobStore(files.get_cache_directory(self.appdata_directory, "vanilla"))
+        self.import_cache = ImportCache(files.get_cache_directory(self.appdata_directory, "godot_import"))
+        self.vanilla = {}
+        self.incremental = incremental
+        self.jobs = jobs
+        self.manifest = PatchManifest.load(self.appdata_directory / "patch_manifest.json")
+        self.written_files = set()
 
         self.mods = None
-        self.builtin_templates = jinja2.Environment(loader=jinja2.FileSystemLoader(self.bundle_dir / "templates"))
-        self.j2 = jinja2.Environment(loader=jinja2.BaseLoader())
+        self.edits = None
+        self.script_patches = []
+        self.card_list = self.deck_list = self.room_list = None
+        self.first_card = self.first_deck = self.first_sprite = None
+        self.card_list_entries = []
+        self.deck_list_entries = []
+        self.encounters = []
+        self.portraits = []
+        self.card_art = []
+        self.foil_maps = []
+        bytecode_cache = jinja2.FileSystemBytecodeCache(
+            str(files.get_cache_directory(self.appdata_directory, "jinja2")),
+            f"__jinja2_v{TEMPLATE_CACHE_VERSION}_%s.cache")
+        self.builtin_templates = jinja2.Environment(loader=jinja2.FileSystemLoader(self.bundle_dir / "templates"),
+                                                    bytecode_cache=bytecode_cache)
+        # wait_for picks random function names, seed it per card so identical inputs give identical output. Jinja
+        # constant-folds plain filters applied to literals, which would pick one name at compile time and reuse it for
+        # every call, so the filter takes the context to make sure it runs on every render
+        self.random = random.Random()
+        self.builtin_templates.filters["random"] = jinja2.pass_context(lambda _context, seq: self.random.choice(seq))
+        self.templates = {}
+        self.on_event = None
+        # trigger sources are loaded by their hash so their compiled bytecode can be cached on disk too
+        self.trigger_sources = {}
+        self.trigger_templates = {}
+        self.j2 = jinja2.Environment(loader=jinja2.FunctionLoader(self.trigger_sources.get),
+                                     bytecode_cache=bytecode_cache)
 
     def patch(self):
         """Patches all installed self.mods into the decompiled D&DG source code."""
-        if self.modified_src.exists():
-            self.logger.info("Wiping modified_src directory")
-            shutil.rmtree(self.modified_src)
-        self.logger.info("Copying src directory to modified_src directory")
-        shutil.copytree(self.vanilla_src, self.modified_src)
+        if not self.prepare_modified_src():
+            self.logger.info("Mods and source code are unchanged, modified_src is up to date")
+            self.written_files = set(self.manifest.written)
+            return
+        self.edits = EditBuffer(self.modified_src)
 
-        self.mods = (Path(f.path) for f in os.scandir(self.appdata_directory / "mods") if f.is_dir())
+        self.mods = sorted(Path(f.path) for f in os.scandir(self.appdata_directory / "mods") if f.is_dir())
         self.logger.debug(f"Mods found: {self.mods}")
 
-        # fm = CardSpritesheet(
-        #     self.modified_src / "assets" / "art" / 'card_visual_effects' / 'foil_card_assets' / "card_foil_mapping.png",
-        #     self.builtin_templates)
-        card_number = last_card_number = FIRST_CARD - 1
-        deck_number = last_deck_number = FIRST_DECK - 1
-        # card_spritesheet = CardSpritesheet(self.modified_src / "assets" / "art" / "card_sprite_sheet.png",
-        #                                    self.builtin_templates)
-        opponent_spritesheet = OpponentSpritesheet(self.modified_src / "assets" / "art" / "portraits" /
-                                                   "spritesheet.png", self.builtin_templates)
+        spritesheet_cache = files.get_cache_directory(self.appdata_directory, "spritesheets")
+        fm = CardSpritesheet(
+            self.output("assets", "art", "card_visual_effects", "foil_card_assets", "card_foil_mapping.png"),
+            spritesheet_cache)
+        card_spritesheet = CardSpritesheet(self.output("assets", "art", "card_sprite_sheet.png"),
+                                           spritesheet_cache)
+        opponent_spritesheet = OpponentSpritesheet(self.output("assets", "art", "portraits", "spritesheet.png"),
+                                                   spritesheet_cache)
 
-        self.j2.globals["wait_for"] = self.builtin_templates.get_template(
-            "wait_for.gd.j2").module.wait_for  # type: ignore
+        self.load_templates()
+        self.read_registries()
 
         # patching for decks
         self.patch_file('ChoiceUI.gd', 'macro_controller.player_starting_deck = starting_deck_string',
@@ -73,226 +129,385 @@ class Patcher:
                         'DeckList.starting_deck_dictionary[deck].name:\n\t\t\t\tstarting_deck_string = deck',
                         'before', True)
 
-        for mod in self.mods:
-            with open(mod / "mod.yaml") as f:
-                metadata = self.clean_dict(yaml.safe_load(f))
-            self.logger.info(f"Patching mod `{metadata["name"]}`")
-            if ('enabled' in metadata and metadata['enabled']) or not 'enabled' in metadata:
-                # check all exports are valid
-                for export in metadata['exports']:
-                    if export not in VALID_EXPORTS:
-                        raise exceptions.InvalidModYamlException(f"Mod `{metadata["name"]}` attempted exporting something "
-                                                                 f"other than {VALID_EXPORTS}")
-
-                card_ids = {}
-                if "cards" in metadata["exports"]:
-                    self.logger.info(f"Patching cards from mod `{metadata["name"]}`")
-                    with open(mod / "cards.yaml") as f:
-                        cards = yaml.safe_load(f)
-                    card_ids = self.get_card_ids_dict(cards=cards, last_card_number=last_card_number)
-                    self.logger.debug(f"Card IDs: {card_ids}")
-                    for card_number, (name, card_data) in enumerate(cards.items(), start=last_card_number + 1):
-                        card_data = self.clean_dict(card_data)
-                        self.logger.debug(f"Card `{name}` (ID: {card_number}) Data: {card_data}")
-                        if "triggers" in card_data:
-                            self.logger.debug(f"Patching triggers for card `{name}`")
-                            self.create_card_effect_files(mod=mod, card_number=card_number, card_ids=card_ids,
-                                                          card_data=card_data)
-                        self.logger.debug(f"Patching card list for card `{name}`")
-                        self.patch_card_list_entry(name=name, card_data=card_data, card_number=card_number)
-                        try:
-                            self.logger.debug(f"Patching card art for card `{name}`")
-                            shutil.copy(mod / "res" / card_data["image"],
-                                self.modified_src / "assets" / "art" / "card_art" / f"{card_number}.png")
-                            with open(self.modified_src / "assets" / "art" / "card_art" / f"{card_number}.png.import", "w") as f:
-                                f.write(self.builtin_templates.get_template("card_art.png.import.j2").render(id=card_number))
-                            # card_spritesheet.add_art(card_number, mod / "res" / card_data["image"])
-                        except KeyError:
-                            self.logger.debug(
-                                f"WARNING: Card `{name}` from mod `{metadata["name"]}` is missing the `Image` property, "
-                                f"using placeholder image")
-                            shutil.copy(self.bundle_dir / "assets" / "placeholder.png",
-                                self.modified_src / "assets" / "art" / "card_art" / f"{card_number}.png")
-                            with open(self.modified_src / "assets" / "art" / "card_art" / f"{card_number}.png.import", "w") as f:
-                                f.write(self.builtin_templates.get_template("card_art.png.import.j2").render(id=card_number))
-                            # card_spritesheet.add_art(card_number, self.bundle_dir / "assets" / "placeholder.png")
-                        try:
-                            self.logger.debug(f"Patching foil map for card `{name}`")
-                            shutil.copy(mod / "res" / card_data["foil"],
-                                        self.modified_src / "assets" / "art" / "card_visual_effects" /
-                                        "foil_card_assets" / "foil_mapping_frames" / f"{card_number}.png")
-                            with open(self.modified_src / "assets" / "art" / "card_visual_effects" /
-                                        "foil_card_assets" / "foil_mapping_frames" / f"{card_number}.png.import",
-                                      "w") as f:
-                                f.write(self.builtin_templates.get_template("card_art.png.import.j2").render(id=card_number))
-                            # fm.add_art(card_number, mod / "res" / card_data["foil"])
-                        except KeyError:
-                            self.logger.debug(f"Card `{name}` from mod `{metadata["name"]}` "
-                                              f"is missing the `Foil` property "
-                                              f"using default foil map")
-                            shutil.copy(self.bundle_dir / "assets" / "default_foil.png",
-                                        self.modified_src / "assets" / "art" / "card_visual_effects" /
-                                        "foil_card_assets" / "foil_mapping_frames" / f"{card_number}.png")
-                            with open(self.modified_src / "assets" / "art" / "card_visual_effects" /
-                                        "foil_card_assets" / "foil_mapping_frames" / f"{card_number}.png.import",
-                                      "w") as f:
-                                f.write(self.builtin_templates.get_template("card_art.png.import.j2").render(
-                                    id=card_number))
-                            # fm.add_art(card_number, self.bundle_dir / "assets" / "default_foil.png")
-                    last_card_number = card_number
-
-                # if exporting decks
-                if "decks" in metadata["exports"]:
-                    # logging
-                    self.logger.info(f"Patching decks from mod `{metadata["name"]}`")
-                    with open(mod / "decks.yaml") as f:
-                        decks = yaml.safe_load(f)
-                    # deck_ids = self.get_deck_ids_dict(decks=decks, last_deck_number=last_deck_number)
-                    # self.logger.debug(f"Deck IDs: {deck_ids}")
-                    for deck_number, (name, deck_data) in enumerate(decks.items(), start=last_deck_number + 1):
-                        deck_data = self.clean_dict(deck_data)
-                        # more logging
-                        self.logger.debug(f"Deck `{name}` (ID: {deck_number}) Data: {deck_data}")
-                        self.patch_deck_list_entry(name=name, deck_data=deck_data, deck_number=deck_number,
-                                                   card_ids=card_ids)
-                    last_deck_number = deck_number
-
-                if "encounters" in metadata["exports"]:
-                    self.logger.info(f"Patching encounters from mod `{metadata["name"]}`")
-                    with open(mod / "encounters.yaml") as f:
-                        encounters = yaml.safe_load(f)
-                    for sprite_id, (name, encounter_data) in enumerate(encounters.items(), 42000):
-                        encounter_data = self.clean_dict(encounter_data)
-                        self.logger.debug(f"Encounter `{name}` Data: {encounter_data}")
-                        self.create_encounter_files(name=name, encounter_data=encounter_data, sprite_id=sprite_id,
-                                                    card_ids=card_ids)
-                        self.logger.debug(f"Patching opponent portrait for encounter `{name}`")
-                        opponent_spritesheet.add_art(sprite_id, mod / "res" / encounter_data["sprite"])
-
-        # self.logger.info("Patching card spritesheet")
-        # card_spritesheet.update_spritesheet()
-        # card_spritesheet.update_tres(self.modified_src / "assets" / "art" / "card_art_sprite_frames.tres")
-
-        self.logger.info("Patching card art processor")
-        with open(self.modified_src / "singletons" / "CardArt.gd") as f:
-            card_art_contents = f.read()
-        with open(self.modified_src / "singletons" / "CardArt.gd", "w") as f:
-            f.write(card_art_contents.replace("for i in 312:", f"for i in {last_card_number}:"))
+        jobs = self.scan_mods()
+        last_card_number = jobs[-1].first_card + len(jobs[-1].cards or ()) - 1 if jobs else self.first_card - 1
+        if self.jobs > 1 and len(jobs) > 1:
+            self.logger.info(f"Patching {len(jobs)} mods with {min(self.jobs, len(jobs))} processes")
+            with ProcessPoolExecutor(max_workers=min(self.jobs, len(jobs)), initializer=_init_worker,
+                                     initargs=(self.appdata_directory,)) as executor:
+                for result in executor.map(_patch_mod_in_worker, jobs):
+                    self.merge_mod_result(result)
+        else:
+            for job in jobs:
+                self.patch_mod(job)
+
+        self.logger.info("Preprocessing card art")
+        self.preprocess_card_art()
+
+        for sprite_id, sprite_path in self.portraits:
+            opponent_spritesheet.add_art(sprite_id, sprite_path)
+        for card_number, art_path in self.card_art:
+            card_spritesheet.add_art(card_number, art_path)
+        for card_number, foil_path in self.foil_maps:
+            fm.add_art(card_number, foil_path)
+
+        self.logger.info("Writing card art")
+        self.write_card_art()
+
+        self.logger.info("Patching card, deck and room lists")
+        self.patch_registries()
+
+        self.logger.info("Patching card spritesheet")
+        card_spritesheet.update_spritesheet()
+        card_spritesheet.update_tres(self.output("assets", "art", "card_art_sprite_frames.tres"))
 
         self.logger.info("Patching opponent spritesheet")
-        opponent_spritesheet.update_spritesheet()
-        opponent_spritesheet.update_tres(self.modified_src / "assets" / "art" / "portraits" /
-                                         "portrait_spriteframes.tres")
-
-        # self.logger.info("Patching foil map")
-        # fm.update_spritesheet()
-        # fm.update_tres(
-        #     self.modified_src / "assets" / "art" / 'card_visual_effects' / 'foil_card_assets' / "FoilMapping.tres")
-
-        self.logger.info("Updating bust limit font")
-        self.update_bust_limit_font()
-        self.add_dndgmod_branding()
-
-        self.logger.info("Unencrypting save file")
-        self.unencrypt_save_file()
-
-    def unencrypt_save_file(self):
-        paths = ["singletons/SystemParameters.gd", "TitleScreen.gd", "events/EventPlayerLost.gd",
-                 "singletons/MetaProgression.gd", "singletons/MetaProgression.gd", "singletons/SystemParameters.gd",
-                 "MacroController.gd"]
-        for path in paths:
-            with open(self.vanilla_src / path) as f:
-                macro_controller_src = f.read()
-            with open(self.modified_src / path, "w") as f:
-                f.write(macro_controller_src.replace('OS.has_feature("standalone")', "false"))
-
-    def patch_file(self, path, pattern, payload, position, match_indent):
-        if not position:
-            position = 'after'
-        file = str(self.modified_src) + '/' + path
-        with open(file) as f:
-            file_contents = f.readlines()
-        patch_num = 0
-        curr_index = 0
-        patched = False
-
-        for line in file_contents:
-            if line.strip('\t\n') == pattern and not patched:
-                indent = len(line) - len(line.strip('\t'))
-                new_line = ''
-                if match_indent:
-                    for i in range(indent):
-                        new_line = new_line + '\t'
-                new_payload = ''
-                if type(payload) is list:
-                    for line in payload:
-                        new_payload = new_payload + new_line + line + '\n'
+        portrait_tres = self.output(PORTRAIT_FRAMES)
+        opponent_spritesheet.update_spritesheet(opponent_spritesheet.find_first_free_cell(portrait_tres))
+        opponent_spritesheet.update_tres(portrait_tres)
+
+        self.logger.info("Patching foil map")
+        fm.update_spritesheet()
+        fm.update_tres(self.output("assets", "art", "card_visual_effects", "foil_card_assets", "FoilMapping.tres"))
+
+        self.logger.info("Applying built-in rewrites")
+        self.apply_builtin_rewrites(first_card=self.first_card, last_card_number=last_card_number)
+
+        self.apply_script_patches()
+        self.edits.flush(self.output)
+
+        self.restore_import_cache()
+
+        if self.incremental:
+            self.manifest.written = sorted(self.written_files)
+            self.manifest.tree = scan_tree(self.modified_src, exclude=(".import",))
+            self.manifest.save()
+
+    def prepare_modified_src(self) -> bool:
+        """Brings modified_src back to a vanilla state before patching.
+
+        The vanilla tree is snapshotted into the blob store first. Outside of incremental mode modified_src is then
+        wiped and rebuilt from the snapshot. In incremental mode, only the files the last patch run wrote, files that
+        changed in the vanilla tree and files that were changed by anything else since the last run are restored,
+        which leaves modified_src identical to a fresh build.
+
+        Returns:
+            False if nothing has changed since the last incremental patch run and patching can be skipped.
+        """
+        self.logger.info("Snapshotting vanilla source code")
+        vanilla = self.vanilla = self.blobs.snapshot(self.vanilla_src)
+        if not self.incremental:
+            self.manifest.invalidate()
+            self.wipe_modified_src(vanilla)
+            return True
+
+        self.logger.info("Hashing mods")
+        inputs = self.hash_inputs(self.manifest.inputs)
+        if not self.manifest.complete or not self.modified_src.exists():
+            self.manifest.invalidate()
+            self.wipe_modified_src(vanilla)
+        elif digests(vanilla) == digests(self.manifest.vanilla) and digests(inputs) == digests(self.manifest.inputs) \
+                and scan_tree(self.modified_src, exclude=(".import",)) == self.manifest.tree:
+            return False
+        else:
+            self.manifest.invalidate()
+            self.restore_modified_src(vanilla)
+        self.manifest.vanilla = vanilla
+        self.manifest.inputs = inputs
+        return True
+
+    def wipe_modified_src(self, vanilla: dict):
+        if self.modified_src.exists():
+            self.logger.info("Stashing Godot import cache")
+            self.import_cache.stash(self.modified_src)
+        self.logger.info("Linking vanilla snapshot into a fresh modified_src directory")
+        self.blobs.materialise(vanilla, self.modified_src)
+
+    def restore_modified_src(self, vanilla: dict):
+        old_vanilla, old_tree = digests(self.manifest.vanilla), self.manifest.tree
+        new_vanilla, tree = digests(vanilla), scan_tree(self.modified_src, exclude=(".import",))
+        stale = set(self.manifest.written)
+        stale.update(path for path in old_vanilla.keys() | new_vanilla.keys()
+                     if old_vanilla.get(path) != new_vanilla.get(path))
+        stale.update(path for path in old_tree.keys() | tree.keys() if old_tree.get(path) != tree.get(path))
+        self.logger.info(f"Restoring {len(stale)} files in modified_src directory")
+        for path in sorted(stale):
+            if path in new_vanilla:
+                self.blobs.materialise_file(new_vanilla[path], self.modified_src / path, link=not godot_owned(path))
+            else:
+                (self.modified_src / path).unlink(missing_ok=True)
+
+    def restore_import_cache(self):
+        """Puts Godot's import cache back into modified_src, invalidating it for every asset whose contents changed."""
+        vanilla = digests(self.vanilla)
+        assets = {}
+        for path in scan_tree(self.modified_src, exclude=(".import",)):
+            if not path.endswith(".import"):
+                continue
+            asset = path.removesuffix(".import")
+            if asset in self.written_files or asset not in vanilla:
+                assets[asset] = hash_file(self.modified_src / asset)
+            else:
+                assets[asset] = vanilla[asset]
+        stale = self.import_cache.restore(self.modified_src, assets)
+        self.logger.info(f"Restored Godot import cache, {len(stale)} assets need reimporting")
+
+    def hash_inputs(self, previous: dict) -> dict:
+        """Hashes everything besides the vanilla source code that the patch output depends on."""
+        inputs = {"version": [0, 0, __VERSION__], "template_cache_version": [0, 0, TEMPLATE_CACHE_VERSION]}
+        for name, root in [("mods", self.appdata_directory / "mods"), ("templates", self.bundle_dir / "templates"),
+                           ("assets", self.bundle_dir / "assets")]:
+            old = {path.removeprefix(f"{name}/"): entry for path, entry in previous.items()
+                   if path.startswith(f"{name}/")}
+            inputs.update({f"{name}/{path}": entry for path, entry in hash_tree(root, old).items()})
+        return inputs
+
+    def output(self, *parts: str) -> Path:
+        """Resolves a path inside modified_src and records that this patch run writes to it.
+
+        Every file the patcher creates or changes must be resolved through here so incremental patch runs know what
+        to restore, and so files still linked to the vanilla snapshot get their own copy before they are written to.
+        """
+        path = Path(*parts)
+        self.written_files.add(path.as_posix())
+        break_link(self.modified_src / path)
+        return self.modified_src / path
+
+    def scan_mods(self) -> list["ModJob"]:
+        """Reads every enabled mod and assigns the card and deck IDs and portrait frames each one will use.
+
+        Returns:
+            One job per enabled mod, in the order the mods are patched in.
+        """
+        jobs = []
+        first_card, first_deck, first_sprite = self.first_card, self.first_deck, self.first_sprite
+        mod_loader = ModLoader(files.get_cache_directory(self.appdata_directory, "mods"))
+        for mod in self.mods:
+            metadata = mod_loader.load_file(mod / "mod.yaml")
+            if 'enabled' in metadata and not metadata['enabled']:
+                self.logger.info(f"Skipping disabled mod `{metadata.get('name', mod.name)}`")
+                continue
+            loaded_mod = mod_loader.load_mod(mod)
+            # check all exports are valid
+            for export in metadata['exports']:
+                if export not in VALID_EXPORTS:
+                    raise exceptions.InvalidModYamlException(f"Mod `{metadata["name"]}` attempted exporting something "
+                                                             f"other than {VALID_EXPORTS}")
+            jobs.append(ModJob(mod=mod, metadata=metadata, cards=loaded_mod.cards, decks=loaded_mod.decks,
+                               encounters=loaded_mod.encounters, first_card=first_card, first_deck=first_deck,
+                               first_sprite=first_sprite))
+            first_card += len(loaded_mod.cards or ())
+            first_deck += len(loaded_mod.decks or ())
+            first_sprite += len(loaded_mod.encounters or ())
+        mod_loader.save()
+        return jobs
+
+    def patch_mod(self, job: "ModJob"):
+        """Patches a single mod's cards, decks and encounters.
+
+        Files that belong to the mod alone (card effects and art) are written straight away. Entries for the files
+        shared by every mod are collected on the patcher, to be written by `patch_registries` once all mods are done.
+        """
+        mod, metadata = job.mod, job.metadata
+        self.logger.info(f"Patching mod `{metadata["name"]}`")
+        card_ids = {}
+        if job.cards is not None:
+            self.logger.info(f"Patching cards from mod `{metadata["name"]}`")
+            card_ids = self.get_card_ids_dict(cards=job.cards, last_card_number=job.first_card - 1)
+            self.logger.debug(f"Card IDs: {card_ids}")
+            for card_number, (name, card) in enumerate(job.cards.items(), start=job.first_card):
+                self.logger.debug(f"Card `{name}` (ID: {card_number}) Data: {card}")
+                if card.triggers:
+                    self.logger.debug(f"Patching triggers for card `{name}`")
+                    self.create_card_effect_files(mod=mod, card_number=card_number, card_ids=card_ids, card=card)
+                self.logger.debug(f"Patching card list for card `{name}`")
+                self.patch_card_list_entry(card=card, card_number=card_number)
+                if card.image is not None:
+                    self.logger.debug(f"Patching card art for card `{name}`")
+                    self.card_art.append((card_number, mod / "res" / card.image))
                 else:
-                    new_payload = new_line + payload
-
-                new_payload = new_payload + '\n'
-                if position == 'at':
-                    file_contents[curr_index] = new_payload
-                    patched = True
-                elif position == 'before':
-                    file_contents.insert(curr_index, new_payload)
-                    patched = True
+                    self.logger.debug(
+                        f"WARNING: Card `{name}` from mod `{metadata["name"]}` is missing the `Image` property, "
+                        f"using placeholder image")
+                    self.card_art.append((card_number, self.bundle_dir / "assets" / "placeholder.png"))
+                if card.foil is not None:
+                    self.logger.debug(f"Patching foil map for card `{name}`")
+                    self.foil_maps.append((card_number, mod / "res" / card.foil))
                 else:
-                    file_contents.insert(curr_index + 1, new_payload)
-                    patched = True
-            curr_index = curr_index + 1
-
-        with open(file, "w") as f:
-            f.writelines(file_contents)
-
-    def patch_card_list_entry(self, name, card_data, card_number):
-        card_list = self.modified_src / "singletons" / "CardList.gd"
-        with open(card_list) as f:
-            card_list_contents = f.read()
-        with open(card_list, "w") as f:
-            entry = (self.builtin_templates.get_template("card_list_entry.j2")
-                     .render(name=name, value=card_data["value"], suit=card_data.get("suit", "special"),
-                             id=card_number, description=card_data["description"],
-                             attributes=card_data.get("attributes", ["REWARD"]),
-                             collection_entry=42000 + card_number, flexible=card_data.get("flexible", None),
-                             keywords=card_data.get("keywords", None)))
-            card_list_contents = "},\n}".join(card_list_contents.rsplit("}\n}", 1))
-            card_list_contents = entry.join(card_list_contents.rsplit("}", 1))
-            f.write(card_list_contents + "\n}")
-
-    def patch_deck_list_entry(self, name, deck_data, deck_number, card_ids):
-        deck_list = self.modified_src / "singletons" / "DeckList.gd"
-        with open(deck_list) as f:
-            # get a list of all lines in the file
-            deck_list_contents = f.readlines()
-        with open(deck_list, "w") as f:
-            entry = (self.builtin_templates.get_template("deck_list_entry.j2")
-                     .render(name=name, cover_card_id=deck_data['cover_card_id'],
-                             id=deck_number, description=deck_data["description"],
-                             deck_list=deck_data['deck_list'], card_ids=card_ids))
-
-            # split the entry into a list of lines
-            entry = entry.split('\n')
-
-            # new entry starts with the entire file minus one bracket to close off the table
-            new_entry = deck_list_contents[0:len(deck_list_contents) - 1]
-            # chuck a comma at the end of the prexisting deck table
-            new_entry[-1] = '\t},\n'
-
-            # append each line in the entry to the new entry, following the original decks
-            for line in entry:
-                new_entry.append(line + '\n')
-            # add the closing bracket to the table
-            new_entry.append('}')
-            # then write the entire list of new lines to the file
-            f.writelines(new_entry)
-
-    def create_card_effect_files(self, mod, card_ids, card_data, card_number):
-        effect_resources = self.modified_src / "card_effect_resources"
+                    self.logger.debug(f"Card `{name}` from mod `{metadata["name"]}` "
+                                      f"is missing the `Foil` property "
+                                      f"using default foil map")
+                    self.foil_maps.append((card_number, self.bundle_dir / "assets" / "default_foil.png"))
+
+        # if exporting decks
+        if job.decks is not None:
+            # logging
+            self.logger.info(f"Patching decks from mod `{metadata["name"]}`")
+            # deck_ids = self.get_deck_ids_dict(decks=decks, last_deck_number=last_deck_number)
+            # self.logger.debug(f"Deck IDs: {deck_ids}")
+            for deck_number, (name, deck) in enumerate(job.decks.items(), start=job.first_deck):
+                # more logging
+                self.logger.debug(f"Deck `{name}` (ID: {deck_number}) Data: {deck}")
+                self.patch_deck_list_entry(deck=deck, deck_number=deck_number, card_ids=card_ids)
+
+        if job.encounters is not None:
+            self.logger.info(f"Patching encounters from mod `{metadata["name"]}`")
+            for sprite_id, (name, encounter) in enumerate(job.encounters.items(), start=job.first_sprite):
+                self.logger.debug(f"Encounter `{name}` Data: {encounter}")
+                self.create_encounter_files(encounter=encounter, sprite_id=sprite_id, card_ids=card_ids)
+                self.logger.debug(f"Patching opponent portrait for encounter `{name}`")
+                self.portraits.append((sprite_id, mod / "res" / encounter.sprite))
+
+    def take_mod_result(self) -> "ModResult":
+        """Hands over (and clears) everything collected by `patch_mod`, so it can be sent back from a worker."""
+        result = ModResult(card_list_entries=self.card_list_entries, deck_list_entries=self.deck_list_entries,
+                           encounters=self.encounters, portraits=self.portraits, card_art=self.card_art,
+                           foil_maps=self.foil_maps, written_files=self.written_files, log=self.logger.records)
+        self.card_list_entries, self.deck_list_entries, self.encounters, self.portraits = [], [], [], []
+        self.card_art, self.foil_maps = [], []
+        self.written_files, self.logger.records = set(), []
+        return result
+
+    def merge_mod_result(self, result: "ModResult"):
+        for level, msg in result.log:
+            self.logger.log(level, msg)
+        self.card_list_entries.extend(result.card_list_entries)
+        self.deck_list_entries.extend(result.deck_list_entries)
+        self.encounters.extend(result.encounters)
+        self.portraits.extend(result.portraits)
+        self.card_art.extend(result.card_art)
+        self.foil_maps.extend(result.foil_maps)
+        self.written_files.update(result.written_files)
+
+    def apply_builtin_rewrites(self, **context):
+        """Applies the rewrites in `builtin_rewrites.yaml.j2` on top of any edits already made to modified_src.
+
+        Each file is read and written once however many rewrites it gets. Files nothing else has edited are rewritten
+        straight from the rewrite cache when their vanilla version has been rewritten the same way before.
+        """
+        replacements, copies = load_rewrites(self.builtin_templates.get_template("builtin_rewrites.yaml.j2"),
+                                             **context)
+        cache = RewriteCache(files.get_cache_directory(self.appdata_directory, "rewrites"))
+        for path, file_replacements in replacements.items():
+            vanilla_digest = self.vanilla[path][2] if path in self.vanilla and not self.edits.loaded(path) else None
+            if vanilla_digest and (contents := cache.load(vanilla_digest, file_replacements)) is not None:
+                self.edits.write(path, contents)
+                continue
+            contents = apply_replacements(self.edits.read(path), file_replacements, path)
+            self.edits.write(path, contents)
+            if vanilla_digest:
+                cache.save(vanilla_digest, file_replacements, contents)
+        cache.prune()
+        for path, asset in copies.items():
+            shutil.copy(self.bundle_dir / "assets" / asset, self.output(path))
+
+    def patch_file(self, path, pattern, payload, position=None, match_indent=False):
+        """Queues a payload to be injected into a script next to the line `pattern`.
+
+        Nothing is read or written until `apply_script_patches`, which applies every queued patch to a file at once.
+        """
+        self.script_patches.append(ScriptPatch(path, pattern, payload, position or "after", match_indent))
+
+    def apply_script_patches(self):
+        """Applies every queued script patch, reading and writing each patched file once."""
+        by_path = {}
+        for patch in self.script_patches:
+            by_path.setdefault(patch.path, []).append(patch)
+        for path, patches in by_path.items():
+            self.edits.write(path, apply_script_patches(self.edits.read(path), patches))
+        self.script_patches = []
+
+    def patch_card_list_entry(self, card, card_number):
+        self.card_list_entries.append(
+            self.templates["card_list_entry.j2"].render(
+                name=card.name, value=card.value, suit=card.suit,
+                id=card_number, description=card.description,
+                attributes=card.attributes,
+                collection_entry=42000 + card_number, flexible=card.flexible,
+                keywords=card.keywords))
+
+    def patch_deck_list_entry(self, deck, deck_number, card_ids):
+        self.deck_list_entries.append(
+            self.templates["deck_list_entry.j2"].render(
+                name=deck.name, cover_card_id=deck.cover_card_id,
+                id=deck_number, description=deck.description,
+                deck_list=deck.deck_list, card_ids=card_ids))
+
+    def preprocess_card_art(self):
+        """Points the collected card art and foil maps at normalised copies from the art cache."""
+        preprocessor = ArtPreprocessor(files.get_cache_directory(self.appdata_directory, "art"),
+                                       CardSpritesheet.CARD_WIDTH, CardSpritesheet.CARD_HEIGHT, self.logger)
+        self.card_art = preprocessor.preprocess_all(self.card_art)
+        self.foil_maps = preprocessor.preprocess_all(self.foil_maps)
+        preprocessor.prune()
+
+    def write_card_art(self):
+        """Writes every new card's art and foil map, along with their `.png.import` files, into modified_src.
+
+        Identical art (e.g. the placeholder shared by every card without an `Image`) is only copied once and hardlinked
+        everywhere else, and the import files are rendered on a thread pool.
+        """
+        foil_directory = ("assets", "art", "card_visual_effects", "foil_card_assets", "foil_mapping_frames")
+        copies = [(path, self.output("assets", "art", "card_art", f"{card_number}.png"))
+                  for card_number, path in self.card_art]
+        copies += [(path, self.output(*foil_directory, f"{card_number}.png")) for card_number, path in self.foil_maps]
+        distinct = place_files(copies)
+        self.logger.debug(f"Wrote {len(copies)} art files from {distinct} distinct images")
+
+        import_files = [self.output("assets", "art", "card_art", f"{card_number}.png.import")
+                        for card_number, _ in self.card_art]
+        import_files += [self.output(*foil_directory, f"{card_number}.png.import") for card_number, _ in self.foil_maps]
+
+        def write_import_file(path: Path):
+            source_path = f"res://{path.relative_to(self.modified_src).as_posix().removesuffix('.import')}"
+            with open(path, "w") as f:
+                f.write(self.templates["card_art.png.import.j2"].render(source_path=source_path,
+                                                                        import_path=get_import_path(source_path)))
+
+        with ThreadPoolExecutor() as executor:
+            list(executor.map(write_import_file, import_files))
+
+    def read_registries(self):
+        """Parses CardList.gd, DeckList.gd and RoomList.gd, and numbers new cards and decks after the game's own.
+
+        New portraits are appended to the portrait SpriteFrames' `default` animation, so their frames are numbered
+        after the ones it already has.
+        """
+        self.card_list = LiteralEditor(self.edits.read(CARD_LIST))
+        self.deck_list = LiteralEditor(self.edits.read(DECK_LIST))
+        self.room_list = RoomListPatcher(self.edits.read(ROOM_LIST))
+        self.first_card = max(numeric_keys(self.card_list[self.card_list.dictionary("card_list")]), default=0) + 1
+        self.first_deck = max(numeric_keys(self.deck_list[self.deck_list.dictionary("starting_deck_dictionary")]),
+                              default=0) + 1
+        self.first_sprite = TresFile.load(self.modified_src / PORTRAIT_FRAMES).frame_count("default")
+        self.logger.debug(f"First new card: {self.first_card}, first new deck: {self.first_deck}, "
+                          f"first new portrait frame: {self.first_sprite}")
+
+    def patch_registries(self):
+        """Adds every collected card, deck and encounter entry to CardList.gd, DeckList.gd and RoomList.gd in one edit
+        per file."""
+        if self.card_list_entries:
+            card_list = self.card_list.dictionary("card_list")
+            for entry in self.card_list_entries:
+                self.card_list.append(card_list, entry)
+            self.edits.write(CARD_LIST, self.card_list.patch())
+        if self.deck_list_entries:
+            deck_list = self.deck_list.dictionary("starting_deck_dictionary")
+            for entry in self.deck_list_entries:
+                self.deck_list.append(deck_list, entry)
+            self.edits.write(DECK_LIST, self.deck_list.patch())
+        if self.encounters:
+            for room_name, encounter_name, difficulty, entry in self.encounters:
+                self.room_list.add_encounter(room_name=room_name, encounter_name=encounter_name,
+                                             difficulty=difficulty, entry=entry)
+            self.edits.write(ROOM_LIST, self.room_list.patch())
+
+    def create_card_effect_files(self, mod, card_ids, card, card_number):
+        self.random.seed(card_number)
         events = []
-        play_effect = 'play' in card_data['triggers']
-        discard_effect = 'discarded' in card_data['triggers']
-        for trigger, source in card_data["triggers"].items():
+        play_effect = 'play' in card.triggers
+        discard_effect = 'discarded' in card.triggers
+        for trigger, source in card.triggers.items():
             if not trigger in VALID_TRIGGERS:
                 self.logger.debug(f"WARNING: Invalid trigger `{trigger}` not in {VALID_TRIGGERS}")
             else:
@@ -307,73 +522,71 @@ class Patcher:
                     extra = '\n    card.connect("card_discarded", self, "_on_card_discarded", [card])'
                 with open(mod / "src" / source) as f:
                     template = f.read().replace("\n", "\n    ")
-                events.append((trigger, self.j2.from_string(template).render(card_ids=card_ids) + extra))
+                events.append((trigger, self.get_trigger_template(template).render(card_ids=card_ids) + extra))
         if not play_effect and discard_effect:
             events.append(('play', 'card.connect("card_discarded", self, "_on_card_discarded", [card])'))
-        on_event = self.builtin_templates.get_template("on_event.gd.j2").module.on_event  # type: ignore
-        with open(effect_resources / f"CardEffect{card_number}.gd", "w") as f:
-            f.write(self.builtin_templates.get_template("CardEffectXXX.gd.j2")
-                    .render(events=events, on_event=on_event))
-        with open(effect_resources / f"card_effect_{card_number}.tres", "w") as f:
-            f.write(self.builtin_templates.get_template("card_effect_XXX.tres.j2").render(id=card_number))
-
-    def update_bust_limit_font(self):
-        shutil.copy(self.bundle_dir / "assets" / "new_font_sheet_3_5.png",
-                    self.modified_src / "assets" / "fonts" / "font_sheet_3_5.png")
-        files.replace_in_file(self.modified_src / "singletons" / "Fonts.gd",
-                              'var three_five_chars = "012/"',
-                              'var three_five_chars = "0123456789/"')
-
-    def add_dndgmod_branding(self):
-        shutil.copy(self.bundle_dir / "assets" / "roaxial_id_card.png",
-                    self.modified_src / "assets" / "art" / "id_card.png")
-        shutil.copy(self.bundle_dir / "assets" / "dndgmod_splash_screen.png",
-                    self.modified_src / "assets" / "logo" / "splash_screen.png")
+        with open(self.output("card_effect_resources", f"CardEffect{card_number}.gd"), "w") as f:
+            f.write(self.templates["CardEffectXXX.gd.j2"].render(events=events, on_event=self.on_event))
+        with open(self.output("card_effect_resources", f"card_effect_{card_number}.tres"), "w") as f:
+            f.write(self.templates["card_effect_XXX.tres.j2"].render(id=card_number))
+
+    def load_templates(self):
+        """Resolves the built-in templates once per patch run, rather than looking them up again for every card."""
+        self.templates = {name: self.builtin_templates.get_template(name) for name in BUILTIN_TEMPLATES}
+        self.on_event = self.templates["on_event.gd.j2"].module.on_event  # type: ignore
+        self.j2.globals["wait_for"] = self.templates["wait_for.gd.j2"].module.wait_for  # type: ignore
+
+    def get_trigger_template(self, source: str) -> jinja2.Template:
+        """Compiles a mod's trigger source, reusing the compiled template for sources that were already seen."""
+        key = hashlib.sha256(source.encode()).hexdigest()
+        if (template := self.trigger_templates.get(key)) is None:
+            self.trigger_sources[key] = source
+            template = self.trigger_templates[key] = self.j2.get_template(key)
+        return template
 
     def get_card_ids_dict(self, cards, last_card_number):
         card_ids = {}
-        for card_number, (_, card_data) in enumerate(cards.items(), start=last_card_number + 1):
-            card_data = self.clean_dict(card_data)
-            if "identifier" in card_data:
-                card_ids[card_data["identifier"]] = card_number
+        for card_number, card in enumerate(cards.values(), start=last_card_number + 1):
+            if card.identifier is not None:
+                card_ids[card.identifier] = card_number
         return card_ids
 
-    def create_encounter_files(self, name, encounter_data, sprite_id, card_ids):
-        hard = "difficulty" in encounter_data and encounter_data["difficulty"].lower().strip() == "hard"
-        room_list.add_encounter_to_room(room_list_file=self.modified_src / "singletons" / "RoomList.gd",
-                                        room_name=encounter_data["location"], encounter_name=name)
-        room_list.add_encounter_to_random_pool(room_list_file=self.modified_src / "singletons" / "RoomList.gd",
-                                               room_name=encounter_data["location"], encounter_name=name,
-                                               difficulty="hard" if hard else "easy")
-
-        room_list_file = self.modified_src / "singletons" / "RoomList.gd"
-        with open(room_list_file) as f:
-            room_list_contents = f.read()
-        with open(room_list_file, "w") as f:
-            room_list_entry = (self.builtin_templates.get_template("room_list_entry.j2")
-                               .render(room_name=encounter_data["location"], encounter_name=name, sprite_id=sprite_id,
-                                       healthpoints=encounter_data.get("healthpoints", 21), deck=encounter_data["deck"],
-                                       hard_deck=encounter_data.get("hard_deck", None),
-                                       foils=encounter_data.get("foils", None),
-                                       hard_foils=encounter_data.get("hard_foils", None),
-                                       modified_stand_point=encounter_data.get("modified_stand_point", None),
-                                       chip_reward=encounter_data["chip_reward"],
-                                       start_dialogue=encounter_data["start_dialogue"],
-                                       end_dialogue=encounter_data["end_dialogue"], card_ids=card_ids))
-            room_list_contents = "},\n}".join(room_list_contents.rsplit("}\n}", 1))
-            room_list_contents = (room_list_entry + "\n}").join(room_list_contents.rsplit("}", 1))
-            f.write(room_list_contents)
-
-    @staticmethod
-    def clean_dict(dictionary: dict):
-        to_return = dict()
-        for key, value in dictionary.items():
-            key = key.lower().strip().replace(" ", "_")
-            if type(value) is dict:
-                value = Patcher.clean_dict(value)
-            to_return[key] = value
-        return to_return
-
-
-def patch_dndg(logger=None):
-    Patcher(logger=logger).patch()
+    def create_encounter_files(self, encounter, sprite_id, card_ids):
+        room_list_entry = (self.templates["room_list_entry.j2"]
+                           .render(room_name=encounter.location, encounter_name=encounter.name, sprite_id=sprite_id,
+                                   healthpoints=encounter.healthpoints, deck=encounter.deck,
+                                   hard_deck=encounter.hard_deck,
+                                   foils=encounter.foils,
+                                   hard_foils=encounter.hard_foils,
+                                   modified_stand_point=encounter.modified_stand_point,
+                                   chip_reward=encounter.chip_reward,
+                                   start_dialogue=encounter.start_dialogue,
+                                   end_dialogue=encounter.end_dialogue, card_ids=card_ids))
+        self.encounters.append((encounter.location, encounter.name, "hard" if encounter.hard else "easy",
+                                room_list_entry))
+
+
+_worker_patcher = None
+
+
+def _init_worker(appdata_directory: Path):
+    global _worker_patcher
+    _worker_patcher = Patcher(logger=RecordingLogger(), appdata_directory=appdata_directory)
+    _worker_patcher.load_templates()
+
+
+def _patch_mod_in_worker(job: ModJob) -> ModResult:
+    _worker_patcher.take_mod_result()
+    _worker_patcher.patch_mod(job)
+    return _worker_patcher.take_mod_result()
+
+
+def patch_dndg(logger=None, incremental: bool = False, jobs: int = 1, appdata_directory: Path = None) -> list[str]:
+    """Patches every installed mod into modified_src.
+
+    Returns:
+        The POSIX-style paths (relative to modified_src) of every file the patch changed or created.
+    """
+    patcher = Patcher(logger=logger, incremental=incremental, jobs=jobs, appdata_directory=appdata_directory)
+    patcher.patch()
+    return sorted(patcher.written_files)
@@ -0,0 +1,274 @@
+from collections import namedtuple
+import hashlib
+import io
+import mmap
+import os
+from pathlib import Path
+import re
+import struct
+import typing
+
+from PIL import Image
+
+from .exceptions import InvalidPckException, UnpackableFileException
+
+PACK_HEADER_MAGIC = 0x43504447  # "GDPC"
+PACK_FORMAT_VERSION = 1  # the format used by every Godot 3.x release
+# magic, format version, engine major/minor/patch, 16 reserved uint32s, file count
+PACK_HEADER = struct.Struct("<5I64xI")
+PACK_ENTRY = struct.Struct("<QQ16s")  # offset, size, MD5
+PACK_ALIGNMENT = 4
+
+STREAM_TEXTURE_HEADER = struct.Struct("<4s4H2I")  # "GDST", width, custom width, height, custom height, flags, format
+STREAM_TEXTURE_FORMAT_RGBA8 = 5
+STREAM_TEXTURE_FORMAT_BIT_PNG = 1 << 20
+TEXTURE_FLAGS = {"flags/mipmaps": 1, "flags/filter": 4, "flags/anisotropic": 8}
+TEXTURE_FLAG_REPEAT, TEXTURE_FLAG_CONVERT_TO_LINEAR, TEXTURE_FLAG_MIRRORED_REPEAT = 2, 16, 32
+
+PckEntry = namedtuple("PckEntry", "path offset size md5")
+
+
+def _pad(length: int) -> int:
+    return -length % PACK_ALIGNMENT
+
+
+class PckReader:
+    """Reads the directory and files of a Godot 3 resource pack (.pck).
+
+    The pack is memory-mapped, so opening it only parses its directory, and files are streamed straight out of the
+    mapping without ever being read into Python objects.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise InvalidPckException(f"`{path}` is not a Godot resource pack")
+        self.view = memoryview(self.map)
+        try:
+            self.version, self.entries = self._read_directory()
+        except (struct.error, UnicodeDecodeError) as e:
+            self.close()
+            raise InvalidPckException(f"`{path}` has a corrupt directory") from e
+        except InvalidPckException:
+            self.close()
+            raise
+
+    def _read_directory(self) -> tuple[tuple[int, int, int], dict[str, PckEntry]]:
+        magic, format_version, *version, count = PACK_HEADER.unpack_from(self.map)
+        if magic != PACK_HEADER_MAGIC:
+            raise InvalidPckException(f"`{self.path}` is not a Godot resource pack")
+        if format_version != PACK_FORMAT_VERSION:
+            raise InvalidPckException(f"`{self.path}` uses pack format {format_version}, only "
+                                      f"{PACK_FORMAT_VERSION} (Godot 3) is supported")
+        entries = {}
+        position = PACK_HEADER.size
+        for _ in range(count):
+            path_length, = struct.unpack_from("<I", self.map, position)
+            position += 4
+            entry_path = bytes(self.view[position:position + path_length]).rstrip(b"\0").decode()
+            position += path_length
+            entries[entry_path] = PckEntry(entry_path, *PACK_ENTRY.unpack_from(self.map, position))
+            position += PACK_ENTRY.size
+        return tuple(version), entries
+
+    def index(self) -> dict[str, list]:
+        """Returns the pack's directory as `{path: [size, md5]}`, which is enough to tell whether two packs differ."""
+        return {path: [entry.size, entry.md5.hex()] for path, entry in self.entries.items()}
+
+    def read(self, path: str) -> bytes:
+        entry = self.entries[path]
+        return self.map[entry.offset:entry.offset + entry.size]
+
+    def copy_to(self, path: str, destination: io.BufferedIOBase):
+        """Streams a file from the pack into another file."""
+        entry = self.entries[path]
+        if entry.offset + entry.size > len(self.map):
+            raise InvalidPckException(f"`{self.path}` ends in the middle of `{path}`")
+        with self.view[entry.offset:entry.offset + entry.size] as data:
+            destination.write(data)
+
+    def extract(self, paths: typing.Iterable[str], destination: Path) -> list[str]:
+        """Writes files from the pack into a directory, keeping their paths relative to `res://`.
+
+        Args:
+            paths: The `res://` paths of the files to extract.
+            destination: The directory to extract into.
+
+        Returns:
+            The requested paths that aren't in the pack.
+        """
+        missing = []
+        for path in paths:
+            if path not in self.entries:
+                missing.append(path)
+                continue
+            target = destination / path.removeprefix("res://")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with open(target, "wb") as f:
+                self.copy_to(path, f)
+        return missing
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class PckWriter:
+    """Writes a Godot 3 resource pack (.pck).
+
+    Files can be added from memory, from disk, or straight from another pack, in which case their data is copied over
+    without being decoded.
+    """
+
+    def __init__(self, version: tuple[int, int, int] = (3, 6, 0)):
+        self.version = version
+        self.files = {}
+
+    def add_data(self, path: str, data: bytes):
+        self.files[path] = (len(data), hashlib.md5(data).digest(), data)
+
+    def add_file(self, path: str, source: Path):
+        with open(source, "rb") as f:
+            self.add_data(path, f.read())
+
+    def add_from_pck(self, reader: PckReader, path: str):
+        entry = reader.entries[path]
+        self.files[path] = (entry.size, entry.md5, reader)
+
+    def remove(self, path: str):
+        self.files.pop(path, None)
+
+    def write(self, output_path: Path):
+        """Writes the pack, replacing `output_path` only once the new pack is complete."""
+        encoded_paths = {path: path.encode() for path in self.files}
+        offset = PACK_HEADER.size + sum(4 + len(encoded) + _pad(len(encoded)) + PACK_ENTRY.size
+                                        for encoded in encoded_paths.values())
+        offsets = {}
+        for path, (size, _, _) in self.files.items():
+            offset += _pad(offset)
+            offsets[path] = offset
+            offset += size
+
+        temporary_path = output_path.with_name(output_path.name + ".tmp")
+        with open(temporary_path, "wb") as f:
+            f.write(PACK_HEADER.pack(PACK_HEADER_MAGIC, PACK_FORMAT_VERSION, *self.version, len(self.files)))
+            for path, (size, md5, _) in self.files.items():
+                encoded = encoded_paths[path]
+                f.write(struct.pack("<I", len(encoded) + _pad(len(encoded))))
+                f.write(encoded + b"\0" * _pad(len(encoded)))
+                f.write(PACK_ENTRY.pack(offsets[path], size, md5))
+            for path, (_, _, source) in self.files.items():
+                f.write(b"\0" * (offsets[path] - f.tell()))
+                if isinstance(source, PckReader):
+                    source.copy_to(path, f)
+                else:
+                    f.write(source)
+        os.replace(temporary_path, output_path)
+
+
+def get_import_path(res_path: str, extension: str = "stex") -> str:
+    """Returns where Godot 3 imports an asset to, i.e. `res://.import/<file name>-<MD5 of its res:// path>.<ext>`.
+
+    Hashing the whole path keeps assets with the same file name in different directories from overwriting each
+    other, e.g. a card's art and its foil map.
+    """
+    return f"res://.import/{res_path.rpartition('/')[2]}-{hashlib.md5(res_path.encode()).hexdigest()}.{extension}"
+
+
+def parse_import_file(contents: str) -> dict[str, str]:
+    """Reads the `key=value` lines of a Godot `.import` file. Values are left as written."""
+    return dict(re.findall(r"^([\w/.]+)=(.*)$", contents, re.MULTILINE))
+
+
+def texture_flags(import_settings: dict[str, str]) -> int:
+    flags = sum(flag for setting, flag in TEXTURE_FLAGS.items() if import_settings.get(setting) == "true")
+    if (repeat := import_settings.get("flags/repeat")) in ("1", "true"):
+        flags |= TEXTURE_FLAG_REPEAT
+    elif repeat == "2":
+        flags |= TEXTURE_FLAG_MIRRORED_REPEAT
+    if import_settings.get("flags/srgb") == "1":
+        flags |= TEXTURE_FLAG_CONVERT_TO_LINEAR
+    return flags
+
+
+def png_to_stream_texture(png_path: Path, flags: int = 0) -> bytes:
+    """Converts a PNG into the lossless StreamTexture (.stex) format Godot 3 imports textures as."""
+    with Image.open(png_path) as image:
+        image = image.convert("RGBA")
+    png = io.BytesIO()
+    image.save(png, "PNG")
+    data = b"PNG " + png.getvalue()
+    return (STREAM_TEXTURE_HEADER.pack(b"GDST", image.width, 0, image.height, 0, flags,
+                                       STREAM_TEXTURE_FORMAT_RGBA8 | STREAM_TEXTURE_FORMAT_BIT_PNG)
+            + struct.pack("<II", 1, len(data)) + data)
+
+
+def add_project_file(writer: PckWriter, project: Path, path: str) -> str:
+    """Adds a file from a Godot project to a pack the way Godot's exporter would.
+
+    Scripts are added as source, overriding any compiled version of them. Textures with an `.import` file are
+    converted to the StreamTexture the `.import` file points at; the source image itself is left out.
+
+    Args:
+        writer: The pack to add the file to.
+        project: The Godot project's root directory.
+        path: The file's POSIX-style path relative to the project.
+
+    Returns:
+        The `res://` path the file was added to the pack as.
+    """
+    res_path = f"res://{path}"
+    if (project / f"{path}.import").exists():
+        with open(project / f"{path}.import") as f:
+            import_settings = parse_import_file(f.read())
+        if import_settings.get("importer") != '"texture"' or "path" not in import_settings \
+                or not path.endswith(".png"):
+            raise UnpackableFileException(f"`{path}` can't be packed without Godot, run a full export instead")
+        import_path = import_settings["path"].strip('"')
+        writer.add_data(import_path, png_to_stream_texture(project / path, texture_flags(import_settings)))
+        return import_path
+    if path.endswith(".gd"):
+        # exported scripts are remapped to their compiled (.gdc) or encrypted (.gde) version
+        stem = res_path.removesuffix(".gd")
+        for compiled_path in (f"{res_path}.remap", f"{stem}.gdc", f"{stem}.gde"):
+            writer.remove(compiled_path)
+    writer.add_file(res_path, project / path)
+    return res_path
+
+
+def build_delta_pck(vanilla_pck: Path, project: Path, paths: list[str], output_path: Path):
+    """Builds a modded pack by adding files from a patched project on top of the vanilla pack.
+
+    Every file in the vanilla pack is copied over as-is, except the ones the patched files replace, so there's no need
+    to export the whole project with Godot.
+
+    Args:
+        vanilla_pck: The unmodded game's pack.
+        project: The patched Godot project (i.e. modified_src).
+        paths: The POSIX-style paths of every file in the project that was patched.
+        output_path: Where to write the modded pack.
+
+    Raises:
+        UnpackableFileException: A patched file can't be packed without Godot, or two patched files would end up at
+            the same path in the pack.
+    """
+    with PckReader(vanilla_pck) as reader:
+        writer = PckWriter(reader.version)
+        for path in reader.entries:
+            writer.add_from_pck(reader, path)
+        added = {}
+        for path in sorted(paths):
+            pck_path = add_project_file(writer, project, path)
+            if (other := added.setdefault(pck_path, path)) != path:
+                raise UnpackableFileException(f"`{other}` and `{path}` would both be packed as `{pck_path}`")
+        writer.write(output_path)
+
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+import typing
+
+import jinja2
+import yaml
+
+from .exceptions import AnchorNotFoundException
+from .mods import YAML_LOADER
+
+
+def load_rewrites(template: jinja2.Template, **context) -> tuple[dict[str, list[tuple[str, str]]], dict[str, str]]:
+    """Renders and reads a rewrite manifest (see `templates/builtin_rewrites.yaml.j2`).
+
+    Args:
+        template: The manifest's template.
+        **context: Variables the manifest refers to.
+
+    Returns:
+        A tuple of the `(old, new)` replacements to make in each file, in order and without duplicates, and the
+        bundled asset each copied file should be replaced with.
+    """
+    manifest = yaml.load(template.render(**context), Loader=YAML_LOADER)
+    replacements = {}
+    for rewrite in manifest.get("replace") or ():
+        replacement = (rewrite["old"], rewrite["new"])
+        for path in rewrite["files"]:
+            if replacement not in (file_replacements := replacements.setdefault(path, [])):
+                file_replacements.append(replacement)
+    copies = {copy["to"]: copy["from"] for copy in manifest.get("copy") or ()}
+    return replacements, copies
+
+
+def apply_replacements(contents: str, replacements: list[tuple[str, str]], path: str = "The file") -> str:
+    """Makes a file's `(old, new)` replacements in order.
+
+    Raises:
+        AnchorNotFoundException: An `old` doesn't appear in the file, e.g. because the game has been updated.
+    """
+    for old, new in replacements:
+        if old not in contents:
+            raise AnchorNotFoundException(f"`{path}` doesn't contain `{old}`")
+        contents = contents.replace(old, new)
+    return contents
+
+
+class RewriteCache:
+    """Caches the result of rewriting vanilla files, keyed by the vanilla file's hash and the rewrites made to it.
+
+    A file that nothing else has touched yet can then be rewritten without reading it at all.
+    """
+
+    def __init__(self, cache_directory: Path):
+        self.cache_directory = cache_directory
+        self.used = set()
+
+    def path(self, vanilla_digest: str, replacements: list[tuple[str, str]]) -> Path:
+        key = hashlib.sha256(f"{vanilla_digest}:{json.dumps(replacements)}".encode()).hexdigest()
+        self.used.add(key)
+        return self.cache_directory / key
+
+    def load(self, vanilla_digest: str, replacements: list[tuple[str, str]]) -> typing.Optional[str]:
+        try:
+            with open(self.path(vanilla_digest, replacements), newline="") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def save(self, vanilla_digest: str, replacements: list[tuple[str, str]], contents: str):
+        path = self.path(vanilla_digest, replacements)
+        temporary_path = path.with_suffix(".tmp")
+        with open(temporary_path, "w", newline="") as f:
+            f.write(contents)
+        os.replace(temporary_path, path)
+
+    def prune(self):
+        """Removes cached files that weren't used since this cache was created."""
+        for entry in os.scandir(self.cache_directory):
+            if entry.name not in self.used:
+                os.unlink(entry.path)
@@ -0,0 +1,52 @@
+import typing
+
+from .exceptions import InvalidEncountersYamlException
+from .gdscript import LiteralEditor
+
+
+class RoomListPatcher:
+    """Adds encounters to the contents of RoomList.gd.
+
+    The room blocks (`var <Room>Rooms = {`) and random encounter pools (`var <room>_<difficulty>_random_encounters =
+    [`) are parsed once when the patcher is created, every encounter is queued with `add_encounter`, and `patch`
+    applies them all in one pass. Each encounter's entry goes into `room_dictionary`, or the file's last dictionary if
+    it has been renamed.
+    """
+
+    def __init__(self, contents: str):
+        self.editor = LiteralEditor(contents)
+        self.rooms = {name.removesuffix("Rooms"): name for name, literal in self.editor.literals.items()
+                      if name.endswith("Rooms") and literal.kind == "dictionary"}
+        self.pools = {name.removesuffix("_random_encounters"): name for name, literal in self.editor.literals.items()
+                      if name.endswith("_random_encounters") and literal.kind == "array"}
+        self.room_dictionary = self.editor.dictionary("room_dictionary")
+
+    def add_encounter(self, room_name: str, encounter_name: str, difficulty: typing.Optional[str],
+                      entry: str = None):
+        """Queues an encounter to be added to its room and random encounter pool.
+
+        Args:
+            room_name: The encounter's location, as written in encounters.yaml.
+            encounter_name: The encounter's name.
+            difficulty: The random encounter pool to add the encounter to, `easy` if not given.
+            entry: The rendered room_list_entry.j2 entry to append to the room list, if any.
+        """
+        if (room := self.rooms.get(room_name.capitalize())) is None:
+            raise InvalidEncountersYamlException(f"Encounter `{encounter_name}` uses unknown location `{room_name}`")
+        pool_name = room_name.lower().replace(" ", "_") + "_" + (difficulty if difficulty else "easy")
+        if (pool := self.pools.get(pool_name)) is None:
+            raise InvalidEncountersYamlException(f"Encounter `{encounter_name}` has no `{pool_name}` random "
+                                                 f"encounter pool to be added to")
+
+        encounter_name = encounter_name.replace(" ", "_")
+        self.editor.append(room, f"\tENCOUNTER_{encounter_name.upper()} = \""
+                                 f"{room_name.lower()}_{encounter_name.lower()}\"")
+        room_enum = "".join(word.capitalize() for word in room_name.split()) + "Rooms"
+        self.editor.append(pool, f"\t{room_enum}.ENCOUNTER_{encounter_name.upper()}")
+        if entry is not None:
+            self.editor.append(self.room_dictionary, entry)
+
+    def patch(self) -> str:
+        """Returns the contents of RoomList.gd with every queued encounter added."""
+        return self.editor.patch()
+
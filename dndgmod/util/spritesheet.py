@@ -1,95 +1,157 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 from PIL import Image
 import math
+import numpy as np
 from pathlib import Path
-import jinja2
 import re
+import shutil
+import typing
+
+from .manifest import hash_file
+from .tres import TresFile
 
 
 class Spritesheet:
     """A generic Godot spritesheet manager
 
     Manages Godot-style spritesheets. Should be subclassed for specific spritesheet types.
+
+    New art is laid out in rows of as many sprites as fit across the existing spritesheet, starting from the first free
+    cell (by default, the first cell below the existing spritesheet). Art is decoded on a thread pool and composited
+    into a single preallocated RGBA array, a batch at a time so only a bounded number of decoded images are ever held
+    in memory at once. If a cache directory is given, composited spritesheets are cached by the hashes of the vanilla
+    spritesheet and every piece of art, so an unchanged set of art is never composited twice.
     """
+    DECODE_BATCH_SIZE = 64
+    REGION_PATTERN = re.compile(r"region = Rect2\( (\d+), (\d+), (\d+), (\d+) \)")
 
-    def __init__(self, spritesheet_path: Path, sprite_width: int, sprite_height: int):
+    def __init__(self, spritesheet_path: Path, sprite_width: int, sprite_height: int, cache_directory: Path = None):
         # TODO: More documentation
         self.sprite_width = sprite_width
         self.sprite_height = sprite_height
         self.spritesheet_path = spritesheet_path
+        self.cache_directory = cache_directory
         self.new_art = {}
         self.art_meta = []
 
     def add_art(self, id_: int, card_art_path: Path):
         self.new_art[id_] = card_art_path
 
-    def update_spritesheet(self):
+    def load_art(self, art_path: Path) -> np.ndarray:
+        """Decodes a piece of art, cropped to at most one sprite's size."""
+        with Image.open(art_path) as art:
+            return np.asarray(art.convert("RGBA"))[:self.sprite_height, :self.sprite_width]
+
+    def find_first_free_cell(self, tres_path: Path) -> int:
+        """Finds the first cell (counting left to right, top to bottom) after every sprite-sized region a .tres uses.
+
+        Any cells left over at the end of the spritesheet's last row can be filled with new art before adding rows.
+        """
+        with Image.open(self.spritesheet_path) as spritesheet:
+            columns = max(spritesheet.width // self.sprite_width, 1)
+        with open(tres_path) as f:
+            regions = [tuple(map(int, match)) for match in self.REGION_PATTERN.findall(f.read())]
+        return max((y // self.sprite_height * columns + x // self.sprite_width + 1
+                    for x, y, width, height in regions if (width, height) == (self.sprite_width, self.sprite_height)),
+                   default=0)
+
+    def get_cache_key(self, first_free_cell: typing.Optional[int]) -> str:
+        key = hashlib.sha256(f"{self.sprite_width}x{self.sprite_height}@{first_free_cell}".encode())
+        key.update(bytes.fromhex(hash_file(self.spritesheet_path)))
+        for id_, art_path in sorted(self.new_art.items(), key=lambda x: x[0]):
+            key.update(f"{id_}:".encode() + bytes.fromhex(hash_file(art_path)))
+        return key.hexdigest()
+
+    def load_cached(self, cache_key: str) -> bool:
+        cached = self.cache_directory / f"{self.spritesheet_path.stem}-{cache_key}"
+        try:
+            with open(cached.with_suffix(".json")) as f:
+                art_meta = json.load(f)
+            shutil.copy(cached.with_suffix(".png"), self.spritesheet_path)
+        except (OSError, ValueError):
+            return False
+        self.art_meta = [(id_, tuple(coordinates)) for id_, coordinates in art_meta]
+        return True
+
+    def save_cached(self, cache_key: str):
+        for old in self.cache_directory.glob(f"{self.spritesheet_path.stem}-*"):
+            old.unlink()
+        cached = self.cache_directory / f"{self.spritesheet_path.stem}-{cache_key}"
+        shutil.copy(self.spritesheet_path, cached.with_suffix(".png"))
+        with open(cached.with_suffix(".json"), "w") as f:
+            json.dump(self.art_meta, f)
+
+    def update_spritesheet(self, first_free_cell: int = None):
+        """Adds the new art to the spritesheet.
+
+        Args:
+            first_free_cell: The first cell new art may be placed in, e.g. from `find_first_free_cell`. Defaults to the
+                first cell below the existing spritesheet.
+        """
         if len(self.new_art) == 0:
             return
+        cache_key = self.get_cache_key(first_free_cell) if self.cache_directory else None
+        if cache_key and self.load_cached(cache_key):
+            return
         with Image.open(self.spritesheet_path) as spritesheet:
-            width, height = spritesheet.size
-            new_spritesheet = Image.new("RGBA", (width,
-                                                 height + 89 * math.ceil(
-                                                     float(len(self.new_art)) / 13.0
-                                                 )))
-            new_spritesheet.paste(spritesheet, (0, 0, width, height))
-        current_x, current_y = 0, height
-        for id_, art_path in sorted(self.new_art.items(), key=lambda x: x[0]):
-            with Image.open(art_path) as art:
-                new_spritesheet.paste(art, (current_x, current_y,
-                                            current_x + self.sprite_width, current_y + self.sprite_height))
-            self.art_meta.append((id_, (current_x, current_y)))
-            current_x += self.sprite_width
-            if current_x >= width:
-                current_x, current_y = 0, current_y + self.sprite_height
-        new_spritesheet.save(self.spritesheet_path)
-        # new_spritesheet.show()
-
-    def update_tres(self, tres_path: Path):
-        raise NotImplementedError
+            old_spritesheet = np.asarray(spritesheet.convert("RGBA"))
+        height, width = old_spritesheet.shape[:2]
+        columns = max(width // self.sprite_width, 1)
+        if first_free_cell is None:
+            first_free_cell = height // self.sprite_height * columns
+        rows = math.ceil((first_free_cell + len(self.new_art)) / columns)
+        new_spritesheet = np.zeros((max(height, rows * self.sprite_height), max(width, self.sprite_width), 4),
+                                   dtype=np.uint8)
+        new_spritesheet[:height, :width] = old_spritesheet
+        del old_spritesheet
+
+        new_art = sorted(self.new_art.items(), key=lambda x: x[0])
+        with ThreadPoolExecutor() as executor:
+            for batch_start in range(0, len(new_art), self.DECODE_BATCH_SIZE):
+                batch = new_art[batch_start:batch_start + self.DECODE_BATCH_SIZE]
+                for cell, ((id_, _), art) in enumerate(zip(batch, executor.map(self.load_art,
+                                                                                (path for _, path in batch))),
+                                                       start=first_free_cell + batch_start):
+                    x = cell % columns * self.sprite_width
+                    y = cell // columns * self.sprite_height
+                    new_spritesheet[y:y + self.sprite_height, x:x + self.sprite_width] = 0
+                    new_spritesheet[y:y + art.shape[0], x:x + art.shape[1]] = art
+                    self.art_meta.append((id_, (x, y)))
+        Image.fromarray(new_spritesheet).save(self.spritesheet_path)
+        if cache_key:
+            self.save_cached(cache_key)
+
+    def update_tres(self, tres_path: Path, animation: str = "default"):
+        """Adds a frame for each piece of new art to the end of an animation in a SpriteFrames .tres.
+
+        The frames are AtlasTextures cut from the spritesheet (the .tres's first external resource), with sub-resource
+        IDs allocated after the highest one already in the file.
+        """
+        if len(self.art_meta) == 0:
+            return
+        tres = TresFile.load(tres_path)
+        ids = [tres.add_sub_resource("AtlasTexture", {
+            "atlas": "ExtResource( 1 )",
+            "region": f"Rect2( {x}, {y}, {self.sprite_width}, {self.sprite_height} )"
+        }) for _, (x, y) in self.art_meta]
+        tres.append_frames(animation, ids)
+        tres.save(tres_path)
 
 
 class CardSpritesheet(Spritesheet):
     CARD_WIDTH, CARD_HEIGHT = 57, 89
 
-    def __init__(self, spritesheet_path: Path, jinja2_env: jinja2.Environment):
-        super().__init__(spritesheet_path, self.CARD_WIDTH, self.CARD_HEIGHT)
-        self.j2 = jinja2_env
-
-    def update_tres(self, tres_path: Path):
-        if len(self.art_meta) == 0:
-            return
-        with open(tres_path) as f:
-            tres = f.read()
-        tres = tres[:tres.find("[resource]") - 1]
-        new_tres = self.j2.get_template("card_art_sprite_frames.tres.j2").render(
-            other_sub_resources=tres, art_meta=self.art_meta, CARD_WIDTH=self.sprite_width,
-            CARD_HEIGHT=self.sprite_height
-        )
-        new_tres = re.sub(r"load_steps=\d+", f"load_steps={self.art_meta[-1][0] + 2}", new_tres)
-        with open(tres_path, "w") as f:
-            f.write(new_tres)
+    def __init__(self, spritesheet_path: Path, cache_directory: Path = None):
+        super().__init__(spritesheet_path, self.CARD_WIDTH, self.CARD_HEIGHT, cache_directory)
 
 
 class OpponentSpritesheet(Spritesheet):
     OPPONENT_WIDTH, OPPONENT_HEIGHT = 32, 32
 
-    def __init__(self, spritesheet_path: Path, jinja2_env: jinja2.Environment):
-        super().__init__(spritesheet_path, self.OPPONENT_WIDTH, self.OPPONENT_HEIGHT)
-        self.j2 = jinja2_env
-
-    def update_tres(self, tres_path: Path):
-        if len(self.art_meta) == 0:
-            return
-        with open(tres_path) as f:
-            tres = f.read()
-        tres = tres[:tres.find("[resource]") - 1]
-        new_tres = self.j2.get_template("opponent_art_sprite_frames.tres.j2").render(
-            other_sub_resources=tres, art_meta=self.art_meta, OPPONENT_WIDTH=self.sprite_width,
-            OPPONENT_HEIGHT=self.sprite_height
-        )
-        new_tres = re.sub(r"load_steps=\d+", f"load_steps={self.art_meta[-1][0] + 2}", new_tres)
-        with open(tres_path, "w") as f:
-            f.write(new_tres)
+    def __init__(self, spritesheet_path: Path, cache_directory: Path = None):
+        super().__init__(spritesheet_path, self.OPPONENT_WIDTH, self.OPPONENT_HEIGHT, cache_directory)
 
 
 if __name__ == "__main__":
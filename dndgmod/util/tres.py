@@ -0,0 +1,90 @@
+from pathlib import Path
+import re
+
+from .exceptions import InvalidTresException
+
+HEADER_PATTERN = re.compile(r"^\[gd_resource [^\]]*\]", re.MULTILINE)
+LOAD_STEPS_PATTERN = re.compile(r"load_steps=\d+")
+EXT_RESOURCE_PATTERN = re.compile(r"^\[ext_resource [^\]]*\]", re.MULTILINE)
+SUB_RESOURCE_PATTERN = re.compile(r"^\[sub_resource [^\]]*\bid=(\d+)[^\]]*\]", re.MULTILINE)
+RESOURCE_SECTION = "\n[resource]\n"
+
+
+class TresFile:
+    """Appends sub-resources and animation frames to a Godot 3 text resource (.tres) in place.
+
+    Everything already in the file is kept exactly as written. New sub-resources get the IDs directly after the
+    highest existing one, and `load_steps` is recomputed from the number of resources the file actually declares, so
+    Godot doesn't pre-size loading for IDs that don't exist.
+    """
+
+    def __init__(self, contents: str):
+        if not HEADER_PATTERN.match(contents) or (split := contents.find(RESOURCE_SECTION)) == -1:
+            raise InvalidTresException("Not a Godot 3 text resource with a [resource] section")
+        self.head = contents[:split + 1]
+        self.resource = contents[split + 1:]
+        self.ext_resource_count = len(EXT_RESOURCE_PATTERN.findall(self.head))
+        sub_resource_ids = [int(id_) for id_ in SUB_RESOURCE_PATTERN.findall(self.head)]
+        self.sub_resource_count = len(sub_resource_ids)
+        self.next_id = max(sub_resource_ids, default=0) + 1
+        self.new_sub_resources = []
+
+    @classmethod
+    def load(cls, path: Path) -> "TresFile":
+        with open(path) as f:
+            return cls(f.read())
+
+    def add_sub_resource(self, type_: str, properties: dict[str, str]) -> int:
+        """Declares a new sub-resource.
+
+        Args:
+            type_: The sub-resource's class, e.g. `AtlasTexture`.
+            properties: Its properties, with values already written the way Godot writes them.
+
+        Returns:
+            The sub-resource's ID.
+        """
+        id_ = self.next_id
+        self.next_id += 1
+        lines = "".join(f"{name} = {value}\n" for name, value in properties.items())
+        self.new_sub_resources.append(f'[sub_resource type="{type_}" id={id_}]\n{lines}\n')
+        return id_
+
+    def find_frames(self, animation: str) -> tuple[re.Match, list[str]]:
+        """Finds a SpriteFrames animation's list of frames.
+
+        Raises:
+            InvalidTresException: The resource has no animation with that name.
+        """
+        match = re.search(rf'"frames": \[([^\]]*)\]([^{{}}]*"name": "{re.escape(animation)}")', self.resource)
+        if not match:
+            raise InvalidTresException(f"The resource has no `{animation}` animation")
+        return match, [frame.strip() for frame in match.group(1).split(",") if frame.strip()]
+
+    def frame_count(self, animation: str) -> int:
+        """Counts a SpriteFrames animation's frames, which is the index the next appended frame will have."""
+        return len(self.find_frames(animation)[1])
+
+    def append_frames(self, animation: str, ids: list[int]):
+        """Appends sub-resources to the end of a SpriteFrames animation's frames.
+
+        Raises:
+            InvalidTresException: The resource has no animation with that name.
+        """
+        match, frames = self.find_frames(animation)
+        frames += [f"SubResource( {id_} )" for id_ in ids]
+        self.resource = (f'{self.resource[:match.start()]}"frames": [ {", ".join(frames)} ]{match.group(2)}'
+                         f"{self.resource[match.end():]}")
+
+    @property
+    def load_steps(self) -> int:
+        # one step per external and sub-resource, plus the resource itself
+        return self.ext_resource_count + self.sub_resource_count + len(self.new_sub_resources) + 1
+
+    def dumps(self) -> str:
+        head = LOAD_STEPS_PATTERN.sub(f"load_steps={self.load_steps}", self.head, count=1)
+        return head + "".join(self.new_sub_resources) + self.resource
+
+    def save(self, path: Path):
+        with open(path, "w") as f:
+            f.write(self.dumps())
@@ -5,8 +5,6 @@ import threading
 import typing
 from pathlib import Path
 
-import yaml
-
 from .about_window import about_window
 
 import tkinter as tk
@@ -22,8 +20,9 @@ import traceback
 from dndgmod.subcommands.compile import compile_dndg
 from dndgmod.subcommands.revert import revert
 from dndgmod.subcommands.decompile import decompile
-from dndgmod.util.files import get_appdata_directory
-from dndgmod.util.patch import Patcher
+from dndgmod.util.environment import get_environment
+from dndgmod.util.files import get_cache_directory
+from dndgmod.util.mods import ModLoader
 
 Card = namedtuple("Card", "name description")
 Card_typehint = Card[str, str]
@@ -219,20 +218,20 @@ class DnDGModGUILayout:
             self.parent = parent
             self.frame = ttk.Frame(self.parent)
 
-            self.mods = (Path(f.path) for f in os.scandir(get_appdata_directory() / "mods") if f.is_dir())
+            appdata_directory = get_environment().appdata_directory
+            self.mods = (Path(f.path) for f in os.scandir(appdata_directory / "mods") if f.is_dir())
             self.mod_tree = []
+            mod_loader = ModLoader(get_cache_directory(appdata_directory, "mods"))
             for mod in self.mods:
-                with open(mod / "mod.yaml") as f:
-                    metadata = Patcher.clean_dict(yaml.safe_load(f))
-                if "cards" not in metadata["exports"]:
+                loaded_mod = mod_loader.load_mod(mod)
+                metadata = loaded_mod.metadata
+                if loaded_mod.cards is None:
                     raise Exception("erm what the sigma where are the cards my dude")
-                with open(mod / "cards.yaml") as f:
-                    cards = yaml.safe_load(f)
                 card_entries = []
-                for name, card_data in cards.items():
-                    card_data = Patcher.clean_dict(card_data)
-                    card_entries.append(Card(name, card_data["description"]))
+                for name, card in loaded_mod.cards.items():
+                    card_entries.append(Card(name, card.description))
                 self.mod_tree.append(Mod(metadata["name"], metadata["version"], metadata["creator"], card_entries, []))
+            mod_loader.save()
 
             self.mod_treeview = DnDGModGUILayout.ModTreeview(self.frame, self.mod_tree)
             self.properties_panel = self.PropertiesPanel(self.frame)
@@ -540,7 +539,7 @@ class DnDGModGUIBridge:
         card_properties_panel.metadata_subpanel.description_entry_var.trace_add("write",
                                                                                 self.update_card_description)
 
-        self.appdata_directory = get_appdata_directory()
+        self.appdata_directory = get_environment(self.logger).appdata_directory
 
         self.layout.mainloop()
 
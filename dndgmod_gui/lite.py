@@ -12,8 +12,8 @@ from . import DnDGModGUILayout, new_thread
 from dndgmod.subcommands.compile import compile_dndg
 from dndgmod.subcommands.revert import revert
 from dndgmod.subcommands.decompile import decompile
-from dndgmod.subcommands.unpackage import unpackage
-from dndgmod.util.files import get_appdata_directory, get_dndg_pck_path
+from dndgmod.subcommands.unpackage import install
+from dndgmod.util.environment import get_environment
 
 
 class DnDGModGUILayoutLite:
@@ -42,7 +42,7 @@ class DnDGModGUILayoutLite:
         self.load_mod_button.grid(sticky=tk.N + tk.E + tk.S + tk.W)
         self.open_mods_folder_button = ttk.Button(self.mod_tools_section, text="Open Mods Folder",
                                                   command=lambda *_: os.system(
-                                                      f"explorer {get_appdata_directory() / 'mods'}"))
+                                                      f"explorer {get_environment().appdata_directory / 'mods'}"))
         self.open_mods_folder_button.grid(sticky=tk.N + tk.E + tk.S + tk.W)
         self.mod_tools_section.grid(sticky=tk.N + tk.E + tk.S + tk.W, padx=10, pady=2)
         self.mod_tools_section.rowconfigure("all", weight=1)
@@ -84,15 +84,15 @@ class DnDGModGUILayoutLite:
         task()
 
     def select_zip_file(self):
-        file_path = Path(filedialog.askopenfilename(
-            title="Select a DnDGMod-Formatted ZIP File",
+        file_paths = filedialog.askopenfilenames(
+            title="Select DnDGMod-Formatted ZIP Files",
             filetypes=[("DnDGMod-Formatted ZIP File", "*.zip")],
             defaultextension=".zip"
-        ))
-        unpackage(file_path, self.logger)
+        )
+        install([Path(file_path) for file_path in file_paths], self.logger)
 
     def launch_dndg(self):
-        process = subprocess.Popen([get_dndg_pck_path().parent / "DnDG_64.exe"],
+        process = subprocess.Popen([get_environment().exe_path],
                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         with process.stdout:
             for line in iter(process.stdout.readline, b''):  # b'\n'-separated lines
@@ -1,4 +1,9 @@
+from multiprocessing import freeze_support
+
 from dndgmod_gui.lite import DnDGModGUILayoutLite
 
-layout = DnDGModGUILayoutLite()
-layout.root.mainloop()
+if __name__ == "__main__":
+    # lets the bundled executable act as a worker process when patching in parallel
+    freeze_support()
+    layout = DnDGModGUILayoutLite()
+    layout.root.mainloop()
@@ -0,0 +1,117 @@
+from pathlib import Path
+
+from PIL import Image
+import pytest
+
+VANILLA_CARDS = 12
+VANILLA_DECKS = 3
+CARD_SIZE = (57, 89)
+
+
+def _image(path: Path, size: tuple[int, int], color: tuple[int, int, int, int]):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGBA", size, color).save(path)
+
+
+def _write(path: Path, contents: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(contents)
+
+
+def _sprite_frames(sheet: str, count: int, columns: int, size: tuple[int, int], animations: list[tuple[str, list]]):
+    sub_resources = "".join(f'[sub_resource type="AtlasTexture" id={i}]\natlas = ExtResource( 1 )\n'
+                            f'region = Rect2( {(i - 1) % columns * size[0]}, {(i - 1) // columns * size[1]}, '
+                            f'{size[0]}, {size[1]} )\n\n' for i in range(1, count + 1))
+    animations = ", ".join('{\n"frames": [ ' + ", ".join(f"SubResource( {i} )" for i in frames)
+                           + f' ],\n"loop": true,\n"name": "{name}",\n"speed": 5.0\n}}' for name, frames in animations)
+    return (f'[gd_resource type="SpriteFrames" load_steps={count + 2} format=2]\n\n'
+            f'[ext_resource path="res://assets/art/{sheet}" type="Texture" id=1]\n\n'
+            f"{sub_resources}[resource]\nanimations = [ {animations} ]\n")
+
+
+def _vanilla_src(src: Path):
+    cards = ",\n".join(f'\t"{i:03d}":{{\n\t\t"name": "Card {i}",\n\t\t"value": {i % 10}\n\t}}'
+                       for i in range(1, VANILLA_CARDS + 1))
+    _write(src / "singletons" / "CardList.gd", f"extends Node\n\nvar card_list = {{\n{cards}\n}}\n")
+    decks = ",\n".join(f'\t"{i:03d}":{{\n\t\t"name": "Deck {i}",\n\t\t"deck_list": ["001", "002"],\n\t}}'
+                       for i in range(1, VANILLA_DECKS + 1))
+    _write(src / "singletons" / "DeckList.gd", f"extends Node\n\nvar starting_deck_dictionary = {{\n{decks}\n}}\n")
+    _write(src / "singletons" / "RoomList.gd", 'extends Node\n\nvar ForestRooms = {\n\tENCOUNTER_GOBLIN = '
+           '"forest_goblin"\n}\n\nvar CaveRooms = {\n\tENCOUNTER_BAT = "cave_bat"\n}\n\n'
+           'var forest_easy_random_encounters = [\n\tForestRooms.ENCOUNTER_GOBLIN\n]\n'
+           'var forest_hard_random_encounters = [\n\tForestRooms.ENCOUNTER_GOBLIN\n]\n'
+           'var cave_easy_random_encounters = [\n\tCaveRooms.ENCOUNTER_BAT\n]\n\n'
+           'var room_dictionary = {\n\tForestRooms.ENCOUNTER_GOBLIN:{\n\t\t"name": "Goblin",\n\t},\n'
+           '\tCaveRooms.ENCOUNTER_BAT:{\n\t\t"name": "Bat",\n\t}\n}\n')
+    _write(src / "ChoiceUI.gd", 'extends Node\n\nfunc _choose():\n\tvar starting_deck_string = ""\n\tif true:\n'
+           '\t\tmacro_controller.player_starting_deck = starting_deck_string\n')
+    _write(src / "singletons" / "CardArt.gd", f"extends Node\n\nfunc _ready():\n\tfor i in {VANILLA_CARDS}:\n"
+           f"\t\tpass\n")
+    _write(src / "singletons" / "Fonts.gd", 'extends Node\nvar three_five_chars = "012/"\n')
+    for path in ["singletons/SystemParameters.gd", "singletons/MetaProgression.gd", "TitleScreen.gd",
+                 "events/EventPlayerLost.gd", "MacroController.gd"]:
+        _write(src / path, 'extends Node\nfunc _ready():\n\tif OS.has_feature("standalone"):\n\t\tpass\n')
+
+    columns = 13
+    rows = -(-VANILLA_CARDS // columns)
+    for i in range(1, VANILLA_CARDS + 1):
+        _image(src / "assets" / "art" / "card_art" / f"{i}.png", CARD_SIZE, (i, 0, 0, 255))
+    foil_directory = src / "assets" / "art" / "card_visual_effects" / "foil_card_assets"
+    _image(src / "assets" / "art" / "card_sprite_sheet.png", (CARD_SIZE[0] * columns, CARD_SIZE[1] * rows),
+           (0, 0, 255, 255))
+    _image(foil_directory / "card_foil_mapping.png", (CARD_SIZE[0] * columns, CARD_SIZE[1] * rows), (0, 255, 0, 255))
+    (foil_directory / "foil_mapping_frames").mkdir()
+    card_frames = [("default", list(range(1, VANILLA_CARDS + 1)))]
+    _write(src / "assets" / "art" / "card_art_sprite_frames.tres",
+           _sprite_frames("card_sprite_sheet.png", VANILLA_CARDS, columns, CARD_SIZE, card_frames))
+    _write(foil_directory / "FoilMapping.tres",
+           _sprite_frames("card_foil_mapping.png", VANILLA_CARDS, columns, CARD_SIZE, card_frames))
+    _image(src / "assets" / "art" / "portraits" / "spritesheet.png", (256, 64), (9, 9, 9, 255))
+    _write(src / "assets" / "art" / "portraits" / "portrait_spriteframes.tres",
+           _sprite_frames("portraits/spritesheet.png", 10, 8, (32, 32),
+                          [("default", list(range(1, 9))), ("player", [9, 10])]))
+    for path in ["assets/fonts/font_sheet_3_5.png", "assets/art/id_card.png", "assets/logo/splash_screen.png"]:
+        _image(src / path, (10, 10), (1, 1, 1, 255))
+    (src / "card_effect_resources").mkdir()
+    _write(src / "project.godot", "config_version=4\n")
+
+
+def _mod(directory: Path, n: int):
+    res = directory / "res"
+    _write(directory / "mod.yaml", f"Name: Mod {n}\nDescription: A test mod\nCreator: Tests\nVersion: 1.0.0\n"
+           f"Exports: [cards, decks, encounters]\n")
+    cards = ""
+    for c in range(4):
+        cards += f"Card {n} {c}:\n  Description: On Play Gain {c} chips.\n  Value: {c}\n  Suit: spades\n" \
+                 f"  Identifier: c{c}\n  Image: art{c % 2}.png\n  Triggers:\n    Play: play.gd.j2\n"
+        if c == 1:
+            cards += "  Foil: foil.png\n"
+    _write(directory / "cards.yaml", cards)
+    # two wait_for calls in one trigger, which must get different function names
+    _write(directory / "src" / "play.gd.j2",
+           '{% call wait_for("card", "choice_made") %}current_player.add_chips({{ card_ids["c1"] }}){% endcall %}\n'
+           '{% call wait_for("card", "choice_made") %}current_player.add_chips(1){% endcall %}\n')
+    for a in range(2):
+        _image(res / f"art{a}.png", CARD_SIZE, (n * 40, a * 60, 100, 255))
+    _image(res / "foil.png", CARD_SIZE, (0, 0, 0, 255))
+    _write(directory / "decks.yaml", f"Deck {n}:\n  Description: A deck\n  Cover Card ID: c0\n"
+           f"  Deck List: [c0, c1, 5, c2]\n")
+    encounters = ""
+    for e, location in enumerate(["forest", "cave"]):
+        encounters += f"Enemy {n} {e}:\n  Location: {location}\n  Deck: [c0, 7]\n  Chip Reward: 10\n" \
+                      f"  Start Dialogue: Hi\n  End Dialogue: Bye\n  Sprite: p{e}.png\n"
+        _image(res / f"p{e}.png", (32, 32), (e * 80, n * 80, 0, 255))
+    _write(directory / "encounters.yaml", encounters)
+
+
+@pytest.fixture
+def make_appdata(tmp_path: Path):
+    """Builds DnDGMod AppData directories holding a small decompiled D&DG and a few mods."""
+    def make_appdata(name: str, mod_count: int = 3) -> Path:
+        appdata = tmp_path / name
+        (appdata / "dependencies").mkdir(parents=True)
+        _vanilla_src(appdata / "src")
+        for n in range(mod_count):
+            _mod(appdata / "mods" / f"mod{n}", n)
+        return appdata
+    return make_appdata
@@ -0,0 +1,32 @@
+import hashlib
+import json
+
+import pytest
+
+from dndgmod.util.dependencies import DEPENDENCIES_FILES, DEPENDENCIES_MANIFEST, DependencyInstaller
+from dndgmod.util.exceptions import DownloadException
+
+
+def make_mirror(mirror, contents: dict[str, bytes], sizes: dict[str, int] = None):
+    files = {}
+    for path, data in contents.items():
+        (mirror / DEPENDENCIES_FILES / path).parent.mkdir(parents=True, exist_ok=True)
+        (mirror / DEPENDENCIES_FILES / path).write_bytes(data)
+        files[path] = {"size": (sizes or {}).get(path, len(data)), "sha256": hashlib.sha256(data).hexdigest()}
+    (mirror / DEPENDENCIES_MANIFEST).write_text(json.dumps({"files": files}))
+
+
+def test_installs_files_with_identical_contents(tmp_path):
+    contents = {f"{directory}/file{i}.bin": b"same contents" for directory in ("a", "b") for i in range(8)}
+    contents["godot.exe"] = b"godot"
+    make_mirror(tmp_path / "mirror", contents)
+    installer = DependencyInstaller(tmp_path / "dependencies", tmp_path / "downloads", str(tmp_path / "mirror"))
+    installer.install()
+    assert {path: (tmp_path / "dependencies" / path).read_bytes() for path in contents} == contents
+
+
+def test_rejects_files_of_the_wrong_size(tmp_path):
+    make_mirror(tmp_path / "mirror", {"godot.exe": b"godot"}, sizes={"godot.exe": 4})
+    installer = DependencyInstaller(tmp_path / "dependencies", tmp_path / "downloads", str(tmp_path / "mirror"))
+    with pytest.raises(DownloadException):
+        installer.install()
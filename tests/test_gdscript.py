@@ -0,0 +1,103 @@
+import pytest
+
+from dndgmod.util.exceptions import GDScriptLiteralException
+from dndgmod.util.gdscript import LiteralEditor, numeric_keys, parse_literals
+from dndgmod.util.room_list import RoomListPatcher
+
+CARD_LIST = '''extends Node
+
+# "001" is the first card, { this brace is only a comment
+var card_list = {
+	"001": {
+		"name": "Strike {one}, \\"two\\"",
+		"tags": ["a", {"b": [1, 2]}],  # nested, with a comment
+	},
+	"002": {"name": 'single, quoted: }'},
+	# "003": {"name": "commented out"},
+	"010": {
+		"name": """multi
+line } string""",
+	},
+}
+
+var suits = ["hearts", "spades", ]
+const numbers = [1, 2, 3]
+
+func _ready():
+	var local = {"999": {}}
+'''
+
+
+def test_parses_top_level_keys_around_nested_values_strings_and_comments():
+    literals = parse_literals(CARD_LIST)
+    assert set(literals) == {"card_list", "suits", "numbers"}
+    assert literals["card_list"].kind == "dictionary"
+    assert literals["card_list"].keys == ['"001"', '"002"', '"010"']
+    assert literals["suits"].kind == "array"
+    assert literals["suits"].keys == ['"hearts"', '"spades"']
+    assert literals["numbers"].keys == ["1", "2", "3"]
+
+
+def test_numeric_keys():
+    assert numeric_keys(parse_literals(CARD_LIST)["card_list"]) == [1, 2, 10]
+    assert numeric_keys(parse_literals('var rooms = {\n\tRooms.A: {},\n\t"x": 1,\n\t"": 2\n}\n')["rooms"]) == []
+
+
+def test_appends_after_the_last_element_with_or_without_a_trailing_comma():
+    editor = LiteralEditor(CARD_LIST)
+    editor.append("card_list", '\t"011": {"name": "New"}')
+    editor.append("card_list", '\t"012": {"name": "Newer"}')
+    editor.append("suits", '"clubs"')
+    editor.append("numbers", "4")
+    patched = parse_literals(editor.patch())
+    assert patched["card_list"].keys == ['"001"', '"002"', '"010"', '"011"', '"012"']
+    assert patched["suits"].keys == ['"hearts"', '"spades"', '"clubs"']
+    assert patched["numbers"].keys == ["1", "2", "3", "4"]
+    assert 'line } string""",\n\t},\n\t"011"' in editor.patch()
+
+
+def test_appends_to_empty_literals():
+    editor = LiteralEditor("var empty = {}\nvar also_empty = [\n]\n")
+    editor.append("empty", '"a": 1')
+    editor.append("also_empty", "1")
+    editor.append("also_empty", "2")
+    patched = parse_literals(editor.patch())
+    assert patched["empty"].keys == ['"a"']
+    assert patched["also_empty"].keys == ["1", "2"]
+
+
+def test_missing_literals_raise():
+    editor = LiteralEditor(CARD_LIST)
+    with pytest.raises(GDScriptLiteralException):
+        editor.append("deck_list", '"001": {}')
+    with pytest.raises(GDScriptLiteralException):
+        editor["local"]
+    with pytest.raises(GDScriptLiteralException):
+        LiteralEditor("var numbers = [1, 2]\n").dictionary("card_list")
+
+
+@pytest.mark.parametrize("contents", ["var broken = {\n\t\"a\": [1, 2}\n}\n", "var broken = {\n\t\"a\": 1\n"])
+def test_unmatched_brackets_raise(contents):
+    with pytest.raises(GDScriptLiteralException):
+        parse_literals(contents)
+
+
+def test_dictionary_falls_back_to_the_last_dictionary():
+    editor = LiteralEditor('var first = {}\nvar names = []\nvar renamed = {\n\t"001": {}\n}\n')
+    assert editor.dictionary("first") == "first"
+    assert editor.dictionary("card_list") == "renamed"
+
+
+def test_room_list_patcher_appends_to_room_dictionary():
+    contents = ('var ForestRooms = {\n\tENCOUNTER_GOBLIN = "forest_goblin"\n}\n'
+                'var forest_easy_random_encounters = [\n\tForestRooms.ENCOUNTER_GOBLIN\n]\n'
+                'var room_dictionary = {\n\tForestRooms.ENCOUNTER_GOBLIN: {"name": "Goblin"},\n}\n'
+                'var unrelated = {}\n')
+    patcher = RoomListPatcher(contents)
+    patcher.add_encounter("forest", "big wolf", None, entry='\tForestRooms.ENCOUNTER_BIG_WOLF: {"name": "Wolf"}')
+    patched = parse_literals(patcher.patch())
+    assert patched["ForestRooms"].keys == ["ENCOUNTER_GOBLIN", "ENCOUNTER_BIG_WOLF"]
+    assert patched["forest_easy_random_encounters"].keys == ["ForestRooms.ENCOUNTER_GOBLIN",
+                                                              "ForestRooms.ENCOUNTER_BIG_WOLF"]
+    assert patched["room_dictionary"].keys == ["ForestRooms.ENCOUNTER_GOBLIN", "ForestRooms.ENCOUNTER_BIG_WOLF"]
+    assert patched["unrelated"].keys == []
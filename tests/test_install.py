@@ -0,0 +1,25 @@
+import zipfile
+
+from dndgmod.util.install import install_mods
+
+
+def make_package(path, files: dict[str, str]):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, contents in files.items():
+            archive.writestr(name, contents)
+
+
+def test_bad_packages_dont_stop_the_batch(tmp_path):
+    make_package(tmp_path / "flat.zip", {"mod.yaml": "Name: Flat\n"})
+    make_package(tmp_path / "nested.zip", {"Nested/mod.yaml": "Name: Nested\n", "Nested/src/a.gd.j2": "pass"})
+    make_package(tmp_path / "slip.zip", {"mod.yaml": "Name: Slip\n", "../escaped.txt": "!"})
+    (tmp_path / "mods").mkdir()
+    (tmp_path / "staging").mkdir()
+    results = install_mods([tmp_path / "flat.zip", tmp_path / "missing.zip", tmp_path / "slip.zip",
+                            tmp_path / "nested.zip"], tmp_path / "mods", tmp_path / "staging")
+    assert results == {tmp_path / "flat.zip": tmp_path / "mods" / "flat", tmp_path / "missing.zip": None,
+                       tmp_path / "slip.zip": None, tmp_path / "nested.zip": tmp_path / "mods" / "nested"}
+    assert (tmp_path / "mods" / "nested" / "src" / "a.gd.j2").read_text() == "pass"
+    assert not (tmp_path / "escaped.txt").exists()
+    assert sorted(path.name for path in (tmp_path / "mods").iterdir()) == ["flat", "nested"]
+    assert not any((tmp_path / "staging").iterdir())
@@ -0,0 +1,32 @@
+import pytest
+
+from dndgmod.util.exceptions import InvalidModYamlException
+from dndgmod.util.mods import Card, ModLoader
+from dndgmod.util.patch import patch_dndg
+
+
+def test_cards_do_not_share_default_triggers():
+    first = Card("First", {"value": 1, "description": "One"})
+    second = Card("Second", {"value": 2, "description": "Two"})
+    first.triggers["play"] = "play.gd.j2"
+    assert second.triggers == {}
+    assert Card.defaults["triggers"] == {}
+
+
+def test_mod_yaml_needs_a_name_and_exports_to_be_loaded(tmp_path):
+    (tmp_path / "mod").mkdir()
+    (tmp_path / "mod" / "mod.yaml").write_text("Name: Nameless\n")
+    mod_loader = ModLoader(tmp_path)
+    assert mod_loader.load_file(tmp_path / "mod" / "mod.yaml") == {"name": "Nameless"}
+    with pytest.raises(InvalidModYamlException):
+        mod_loader.load_mod(tmp_path / "mod")
+
+
+def test_disabled_mods_are_not_validated(make_appdata):
+    appdata = make_appdata("disabled", mod_count=1)
+    (appdata / "mods" / "half_written").mkdir()
+    (appdata / "mods" / "half_written" / "mod.yaml").write_text("Enabled: false\n")
+    assert patch_dndg(appdata_directory=appdata)
+    (appdata / "mods" / "half_written" / "mod.yaml").write_text("Enabled: true\n")
+    with pytest.raises(InvalidModYamlException):
+        patch_dndg(appdata_directory=appdata)
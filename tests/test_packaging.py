@@ -0,0 +1,40 @@
+import os
+import zipfile
+
+from dndgmod.util import packaging
+from dndgmod.util.packaging import read_package_manifest, write_package
+
+
+def make_mod(directory):
+    (directory / "res").mkdir(parents=True)
+    (directory / "mod.yaml").write_text("Name: Test\n" * 100)
+    (directory / "res" / "art.png").write_bytes(os.urandom(50000))
+    (directory / "res" / "noise.bin").write_bytes(os.urandom(300000))
+    (directory / "res" / "ü.txt").write_text("héllo" * 10000)
+
+
+def test_packages_are_reproducible(tmp_path, monkeypatch):
+    # a tiny spool and window, so spilling to disk and waiting on the window are exercised too
+    monkeypatch.setattr(packaging, "SPOOL_SIZE", 1024)
+    monkeypatch.setattr(packaging, "MAX_PENDING_BYTES", 1024)
+    make_mod(tmp_path / "mod")
+    assert write_package(tmp_path / "mod", tmp_path / "a.zip", workers=1)
+    os.utime(tmp_path / "mod" / "mod.yaml", (0, 0))
+    assert write_package(tmp_path / "mod", tmp_path / "b.zip", workers=4)
+    assert (tmp_path / "a.zip").read_bytes() == (tmp_path / "b.zip").read_bytes()
+
+    with zipfile.ZipFile(tmp_path / "a.zip") as archive:
+        assert archive.testzip() is None
+        assert archive.getinfo("res/art.png").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("mod.yaml").compress_type == zipfile.ZIP_DEFLATED
+        for path in ["mod.yaml", "res/art.png", "res/noise.bin", "res/ü.txt"]:
+            assert archive.read(path) == (tmp_path / "mod" / path).read_bytes()
+
+
+def test_unchanged_mods_are_not_repackaged(tmp_path):
+    make_mod(tmp_path / "mod")
+    assert write_package(tmp_path / "mod", tmp_path / "mod.zip")
+    assert not write_package(tmp_path / "mod", tmp_path / "mod.zip")
+    (tmp_path / "mod" / "mod.yaml").write_text("Name: Changed\n")
+    assert write_package(tmp_path / "mod", tmp_path / "mod.zip")
+    assert "mod.yaml" in read_package_manifest(tmp_path / "mod.zip")["files"]
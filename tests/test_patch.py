@@ -0,0 +1,87 @@
+import re
+
+from PIL import Image
+
+from dndgmod.util.patch import patch_dndg
+
+
+def read_tree(root):
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in sorted(root.rglob("*"))
+            if path.is_file() and path.relative_to(root).parts[0] != ".import"}
+
+
+def test_parallel_patch_matches_serial(make_appdata):
+    serial, parallel = make_appdata("serial"), make_appdata("parallel")
+    serial_written = patch_dndg(jobs=1, appdata_directory=serial)
+    parallel_written = patch_dndg(jobs=4, appdata_directory=parallel)
+    assert serial_written == parallel_written
+    assert read_tree(serial / "modified_src") == read_tree(parallel / "modified_src")
+
+
+def test_wait_for_names_are_unique_and_reproducible(make_appdata):
+    first, second = make_appdata("first"), make_appdata("second")
+    patch_dndg(appdata_directory=first)
+    patch_dndg(appdata_directory=second)
+    effects = sorted((first / "modified_src" / "card_effect_resources").glob("CardEffect*.gd"))
+    assert effects
+    for effect in effects:
+        names = re.findall(r"^func (_on_choice_made_\d+)", effect.read_text(), re.MULTILINE)
+        assert len(names) == 2 and names[0] != names[1]
+        assert effect.read_bytes() == (second / "modified_src" / "card_effect_resources" / effect.name).read_bytes()
+
+
+def edit_mods(appdata):
+    cards = appdata / "mods" / "mod0" / "cards.yaml"
+    contents = cards.read_text().replace("Gain 0 chips", "Gain 100 chips")
+    cards.write_text(contents[:contents.index("Card 0 3:")])
+    with open(appdata / "mods" / "mod1" / "mod.yaml", "a") as f:
+        f.write("Enabled: false\n")
+
+
+def test_incremental_patch_matches_clean_patch(make_appdata):
+    incremental, clean = make_appdata("incremental"), make_appdata("clean")
+    patch_dndg(incremental=True, appdata_directory=incremental)
+    first_patch = read_tree(incremental / "modified_src")
+    vanilla_store = read_tree(incremental / "cache" / "vanilla")
+    assert vanilla_store
+    edit_mods(incremental)
+    edit_mods(clean)
+    patch_dndg(incremental=True, appdata_directory=incremental)
+    patch_dndg(appdata_directory=clean)
+    assert read_tree(incremental / "modified_src") == read_tree(clean / "modified_src") != first_patch
+    assert read_tree(incremental / "cache" / "vanilla") == vanilla_store
+
+
+def test_portraits_land_on_the_frames_their_encounters_use(make_appdata):
+    appdata = make_appdata("portraits")
+    patch_dndg(jobs=4, appdata_directory=appdata)
+    portraits = appdata / "modified_src" / "assets" / "art" / "portraits"
+    tres = (portraits / "portrait_spriteframes.tres").read_text()
+    regions = {int(id_): (int(x), int(y)) for id_, x, y in
+               re.findall(r"id=(\d+)\]\natlas = ExtResource\( 1 \)\nregion = Rect2\( (\d+), (\d+),", tres)}
+    default = re.search(r'"frames": \[([^\]]*)\][^{}]*"name": "default"', tres).group(1)
+    frames = [int(id_) for id_ in re.findall(r"SubResource\( (\d+) \)", default)]
+    room_list = (appdata / "modified_src" / "singletons" / "RoomList.gd").read_text()
+    sprites = dict(re.findall(r'"name": "(Enemy \d \d)",\n\s*"type": "opponent",\n\s*"sprite": (\d+),', room_list))
+    assert len(sprites) == 6 and len(set(sprites.values())) == 6
+    with Image.open(portraits / "spritesheet.png") as spritesheet:
+        for name, sprite in sprites.items():
+            n, e = map(int, name.split()[1:])
+            assert spritesheet.getpixel(regions[frames[int(sprite)]]) == (e * 80, n * 80, 0, 255)
+
+
+def test_sprite_frames_have_dense_ids_and_matching_load_steps(make_appdata):
+    appdata = make_appdata("tres")
+    patch_dndg(appdata_directory=appdata)
+    art = appdata / "modified_src" / "assets" / "art"
+    for path in [art / "portraits" / "portrait_spriteframes.tres", art / "card_art_sprite_frames.tres",
+                 art / "card_visual_effects" / "foil_card_assets" / "FoilMapping.tres"]:
+        tres = path.read_text()
+        ids = [int(id_) for id_ in re.findall(r'^\[sub_resource type="AtlasTexture" id=(\d+)\]$', tres, re.MULTILINE)]
+        ext_resources = re.findall(r"^\[ext_resource ", tres, re.MULTILINE)
+        assert ids == list(range(1, len(ids) + 1))
+        assert int(re.search(r"load_steps=(\d+)", tres).group(1)) == len(ext_resources) + len(ids) + 1
+        used = {int(id_) for id_ in re.findall(r"SubResource\( (\d+) \)", tres)}
+        assert used == set(ids)
+    assert len(re.findall(r"^\[sub_resource ", (art / "portraits" / "portrait_spriteframes.tres").read_text(),
+                          re.MULTILINE)) == 10 + 6
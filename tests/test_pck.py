@@ -0,0 +1,121 @@
+import hashlib
+import struct
+
+from PIL import Image
+import pytest
+
+from dndgmod.util.exceptions import InvalidPckException, UnpackableFileException
+from dndgmod.util.pck import PckReader, PckWriter, build_delta_pck, get_import_path
+
+FILES = {
+    "res://project.binary": b"\x01\x02\x03",
+    "res://singletons/CardList.gdc": b"compiled card list" * 10,
+    "res://.import/1.png-0123456789abcdef0123456789abcdef.stex": b"GDST" + bytes(range(200)),
+}
+
+
+def godot_pck(files: dict[str, bytes], version=(3, 6, 0)) -> bytes:
+    """Lays out a pack exactly the way Godot 3's PCKPacker does, without going through PckWriter."""
+    header = struct.pack("<5I", 0x43504447, 1, *version) + struct.pack("<16I", *[0] * 16)
+    header += struct.pack("<I", len(files))
+    directory_size = sum(4 + len(path.encode()) + -len(path.encode()) % 4 + 8 + 8 + 16 for path in files)
+    directory, data = b"", b""
+    offset = len(header) + directory_size
+    for path, contents in files.items():
+        encoded = path.encode()
+        encoded += b"\0" * (-len(encoded) % 4)
+        directory += struct.pack("<I", len(encoded)) + encoded
+        directory += struct.pack("<QQ", offset + len(data), len(contents)) + hashlib.md5(contents).digest()
+        data += contents
+    return header + directory + data
+
+
+def parse_godot_pck(pck: bytes) -> tuple[tuple[int, ...], dict[str, bytes]]:
+    """Reads a pack the way Godot 3's PackedSourcePCK does, without going through PckReader."""
+    magic, format_version, *version = struct.unpack_from("<5I", pck)
+    assert (magic, format_version) == (0x43504447, 1)
+    assert struct.unpack_from("<16I", pck, 20) == (0,) * 16
+    count, = struct.unpack_from("<I", pck, 84)
+    position, files = 88, {}
+    for _ in range(count):
+        length, = struct.unpack_from("<I", pck, position)
+        path = pck[position + 4:position + 4 + length].rstrip(b"\0").decode()
+        offset, size, md5 = struct.unpack_from("<QQ16s", pck, position + 4 + length)
+        position += 4 + length + 32
+        files[path] = pck[offset:offset + size]
+        assert hashlib.md5(files[path]).digest() == md5
+    return tuple(version), files
+
+
+def test_reads_godot_layout(tmp_path):
+    (tmp_path / "game.pck").write_bytes(godot_pck(FILES, (3, 5, 1)))
+    with PckReader(tmp_path / "game.pck") as reader:
+        assert reader.version == (3, 5, 1)
+        assert list(reader.entries) == list(FILES)
+        for path, contents in FILES.items():
+            assert reader.read(path) == contents
+            assert reader.index()[path] == [len(contents), hashlib.md5(contents).hexdigest()]
+
+
+def test_writes_godot_layout(tmp_path):
+    writer = PckWriter((3, 6, 0))
+    for path, contents in FILES.items():
+        writer.add_data(path, contents)
+    writer.write(tmp_path / "modded.pck")
+    assert parse_godot_pck((tmp_path / "modded.pck").read_bytes()) == ((3, 6, 0), FILES)
+
+
+def test_round_trips_through_another_pack(tmp_path):
+    (tmp_path / "vanilla.pck").write_bytes(godot_pck(FILES))
+    with PckReader(tmp_path / "vanilla.pck") as reader:
+        writer = PckWriter(reader.version)
+        for path in reader.entries:
+            writer.add_from_pck(reader, path)
+        writer.remove("res://project.binary")
+        writer.add_data("res://singletons/CardList.gd", b"extends Node\n")
+        writer.write(tmp_path / "modded.pck")
+    expected = {path: contents for path, contents in FILES.items() if path != "res://project.binary"}
+    expected["res://singletons/CardList.gd"] = b"extends Node\n"
+    assert parse_godot_pck((tmp_path / "modded.pck").read_bytes()) == ((3, 6, 0), expected)
+    with PckReader(tmp_path / "modded.pck") as reader:
+        assert {path: reader.read(path) for path in reader.entries} == expected
+
+
+def test_rejects_other_files(tmp_path):
+    (tmp_path / "not.pck").write_bytes(b"PK\x03\x04" + b"\0" * 100)
+    with pytest.raises(InvalidPckException):
+        PckReader(tmp_path / "not.pck")
+
+
+def test_import_paths_match_godot():
+    # the path Godot 3 imports every new project's icon to
+    assert get_import_path("res://icon.png") == "res://.import/icon.png-487276ed1e3a0c39cad0279d744ee560.stex"
+
+
+def _texture(project, path: str, import_path: str):
+    (project / path).parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGBA", (4, 4), (255, 0, 0, 255)).save(project / path)
+    (project / f"{path}.import").write_text(f'[remap]\n\nimporter="texture"\ntype="StreamTexture"\n'
+                                            f'path="{import_path}"\n')
+
+
+def test_delta_pck_keeps_same_named_textures_apart(tmp_path):
+    (tmp_path / "vanilla.pck").write_bytes(godot_pck(FILES))
+    project = tmp_path / "modified_src"
+    paths = ["assets/art/card_art/313.png", "assets/art/foil_mapping_frames/313.png"]
+    for path in paths:
+        _texture(project, path, get_import_path(f"res://{path}"))
+    build_delta_pck(tmp_path / "vanilla.pck", project, paths, tmp_path / "modded.pck")
+    _, files = parse_godot_pck((tmp_path / "modded.pck").read_bytes())
+    for path in paths:
+        assert files[get_import_path(f"res://{path}")].startswith(b"GDST")
+
+
+def test_delta_pck_rejects_colliding_imports(tmp_path):
+    (tmp_path / "vanilla.pck").write_bytes(godot_pck(FILES))
+    project = tmp_path / "modified_src"
+    paths = ["assets/art/card_art/313.png", "assets/art/foil_mapping_frames/313.png"]
+    for path in paths:
+        _texture(project, path, "res://.import/313.png.stex")
+    with pytest.raises(UnpackableFileException):
+        build_delta_pck(tmp_path / "vanilla.pck", project, paths, tmp_path / "modded.pck")
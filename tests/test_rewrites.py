@@ -0,0 +1,15 @@
+import pytest
+
+from dndgmod.util.exceptions import AnchorNotFoundException
+from dndgmod.util.rewrites import apply_replacements
+
+
+def test_replaces_every_occurrence_in_order():
+    contents = 'if OS.has_feature("standalone"):\n\tpass\nif OS.has_feature("standalone"):\n\tpass\n'
+    replacements = [('OS.has_feature("standalone")', "false"), ("if false:", "if true:")]
+    assert apply_replacements(contents, replacements) == "if true:\n\tpass\nif true:\n\tpass\n"
+
+
+def test_missing_text_raises():
+    with pytest.raises(AnchorNotFoundException, match="singletons/CardArt.gd"):
+        apply_replacements("for i in 313:\n", [("for i in 312:", "for i in 400:")], "singletons/CardArt.gd")